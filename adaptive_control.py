@@ -0,0 +1,39 @@
+import math
+
+class AdaptiveController:
+    """Decides how hard an overloaded VM should work through its message backlog.
+
+    Once the queue is deeper than queue_high or the message just processed waited longer
+    than wait_high_ms, the VM drains extra messages per tick (doubling up to
+    max_extra_dequeues) and, if slowdown_factor > 1, asks its peers to tick slower for
+    slowdown_duration seconds. Extra dequeues step back down once the backlog has halved.
+    """
+
+    def __init__(self, queue_high=5, wait_high_ms=500.0, max_extra_dequeues=4, slowdown_factor=0.0,
+                 slowdown_duration=2.0, slowdown_cooldown=2.0):
+        self.queue_high = queue_high
+        self.wait_high_ms = wait_high_ms
+        self.max_extra_dequeues = max_extra_dequeues
+        self.slowdown_factor = slowdown_factor
+        self.slowdown_duration = slowdown_duration
+        self.slowdown_cooldown = slowdown_cooldown
+        self.extra_dequeues = 0
+        self.last_slowdown = -math.inf
+
+    def update(self, queue_length, queue_wait_ms, now):
+        """Adjust extra dequeues; return (whether they changed, whether to signal peers to slow down)."""
+        overloaded = queue_length >= self.queue_high or queue_wait_ms >= self.wait_high_ms
+        relaxed = queue_length <= self.queue_high // 2 and queue_wait_ms < self.wait_high_ms / 2
+        previous = self.extra_dequeues
+        if overloaded:
+            self.extra_dequeues = min(self.max_extra_dequeues, max(1, 2 * self.extra_dequeues))
+        elif relaxed:
+            self.extra_dequeues = max(0, self.extra_dequeues - 1)
+        signal = overloaded and self.slowdown_factor > 1 and now - self.last_slowdown >= self.slowdown_cooldown
+        if signal:
+            self.last_slowdown = now
+        return self.extra_dequeues != previous, signal
+
+    def slowdown_message(self, sender):
+        return {"sender": sender, "type": "slowdown", "factor": self.slowdown_factor,
+                "duration": self.slowdown_duration}
@@ -1,97 +1,242 @@
 import os
+import numpy as np
 import pandas as pd
 import re
 import matplotlib.pyplot as plt
+from clock_board import SNAPSHOT_FILENAME, read_snapshots
+from log_rotation import log_segments, read_log_lines
+from columnar_log import COLUMNAR_FORMATS, EVENT_NAMES, read_table, trial_table_path
 
 # Set the base directory for trials
 BASE_DIR = "trials"  # Change if your trials are in a different folder
 
-# Load logs into DataFrames
+# Transport summaries and adaptive controller actions rather than clock events
+NON_EVENT_TYPES = {"TRANSPORT", "ADAPT"}
+
+# Jumps above this count as large gaps (must match LARGE_JUMP in the simulator)
+LARGE_GAP = 2
+
+LOG_LINE = re.compile(r'(\w+)[^|]* \| System Time: ([\d.]+) \| Logical Clock: (\d+) \|(.*)')
+NUMERIC_FIELD = re.compile(r'([A-Z][\w ]*?): (-?\d+(?:\.\d+)?)')
+SENDER_FIELD = re.compile(r'From VM (\d+)')
+TEXT_LOG_NAME = re.compile(r'machine_(\d+)\.log(\.\d+(\.gz|\.zst)?)?$')
+
+# Load logs into DataFrames (rotated and compressed segments are read as one stream)
 def parse_log(file_path):
     log_data = []
-    with open(file_path, 'r') as file:
-        for line in file:
-            match = re.match(r'(\w+) \| System Time: ([\d.]+) \| Logical Clock: (\d+)', line)
-            if match:
-                event_type, system_time, logical_clock = match.groups()
-                log_data.append({"Event": event_type, "System Time": float(system_time), "Logical Clock": int(logical_clock)})
+    for line in read_log_lines(file_path):
+        match = LOG_LINE.match(line)
+        if match:
+            event_type, system_time, logical_clock, details = match.groups()
+            if event_type in NON_EVENT_TYPES:
+                continue
+            row = {"Event": event_type, "System Time": float(system_time), "Logical Clock": int(logical_clock)}
+            # Numeric details such as Queue Length, Skipped Internal or WINDOW aggregates
+            for name, value in NUMERIC_FIELD.findall(details):
+                row[name] = float(value)
+            if event_type == "RECEIVE":
+                sender = SENDER_FIELD.search(details)
+                if sender:
+                    row["From VM"] = int(sender.group(1))
+            log_data.append(row)
     return pd.DataFrame(log_data)
 
+# Totals behind the jump/gap statistics for full, sampled and aggregate (WINDOW) logs
+def clock_jump_totals(df):
+    if (df["Event"] == "WINDOW").any():
+        windows = df[df["Event"] == "WINDOW"]
+        return {"advance": windows["Clock Advance"].sum(), "events": windows["Events"].sum(),
+                "max": windows["Max Jump"].max(), "min": windows["Min Jump"].min(),
+                "large": windows["Large Jumps"].sum()}
+    jumps = df["Logical Clock"].diff().fillna(0)
+    if "Skipped Internal" not in df.columns:
+        return {"advance": jumps.sum(), "events": len(df), "max": jumps.max(), "min": jumps.min(),
+                "large": (jumps > LARGE_GAP).sum()}
+    # Every skipped INTERNAL event advanced the clock by exactly 1 before the logged line.
+    skipped = df["Skipped Internal"].fillna(0)
+    own_jumps = (jumps - skipped).clip(lower=0)
+    skipped_events = skipped.sum()
+    return {"advance": jumps.sum(), "events": len(df) + skipped_events,
+            "max": max(own_jumps.max(), 1 if skipped_events else 0), "min": own_jumps.min(),
+            "large": (own_jumps > LARGE_GAP).sum()}
+
 # Function to analyze clock jumps
 def analyze_clock_jumps(df, vm_id):
-    df["Clock Jump"] = df["Logical Clock"].diff().fillna(0)
+    totals = clock_jump_totals(df)
     return {
         "VM": vm_id,
-        "Avg Clock Jump": df["Clock Jump"].mean(),
-        "Max Clock Jump": df["Clock Jump"].max(),
-        "Min Clock Jump": df["Clock Jump"].min()
+        "Avg Clock Jump": totals["advance"] / totals["events"],
+        "Max Clock Jump": totals["max"],
+        "Min Clock Jump": totals["min"]
     }
 
 # Function to analyze logical clock gaps
 def analyze_clock_gaps(df, vm_id):
-    gaps = df["Logical Clock"].diff().fillna(0)
-    large_gaps = (gaps > 2).sum()  # Arbitrarily defining a "large gap" as >2
+    totals = clock_jump_totals(df)
     return {
         "VM": vm_id,
-        "Avg Gap Size": gaps.mean(),
-        "Large Gaps Count": large_gaps
+        "Avg Gap Size": totals["advance"] / totals["events"],
+        "Large Gaps Count": totals["large"]  # Arbitrarily defining a "large gap" as >2
     }
 
-# Loop through each trial folder
-for trial_folder in sorted(os.listdir(BASE_DIR)):
-    trial_path = os.path.join(BASE_DIR, trial_folder)
-    
-    if os.path.isdir(trial_path):  # Ensure it's a folder
-        print(f"Processing {trial_folder}...")
-
-        # Load logs for each VM
-        log_files = {f"machine_{i}.log": None for i in range(3)}
-        dataframes = {}
-
-        for file in log_files.keys():
-            file_path = os.path.join(trial_path, file)
-            if os.path.exists(file_path):
-                dataframes[file] = parse_log(file_path)
-
-        # Ensure all VMs have data
-        if len(dataframes) == 3:
-            df_vm0, df_vm1, df_vm2 = dataframes.values()
-            
-            # Analyze clock jumps
-            clock_jump_analysis = [
-                analyze_clock_jumps(df_vm0, 0),
-                analyze_clock_jumps(df_vm1, 1),
-                analyze_clock_jumps(df_vm2, 2)
-            ]
-            clock_jump_df = pd.DataFrame(clock_jump_analysis)
-
-            # Analyze logical clock gaps
-            clock_gap_analysis = [
-                analyze_clock_gaps(df_vm0, 0),
-                analyze_clock_gaps(df_vm1, 1),
-                analyze_clock_gaps(df_vm2, 2)
-            ]
-            clock_gap_df = pd.DataFrame(clock_gap_analysis)
-
-            # Save analysis to CSV
-            clock_jump_df.to_csv(os.path.join(trial_path, "logical_clock_jump_analysis.csv"), index=False)
-            clock_gap_df.to_csv(os.path.join(trial_path, "logical_clock_gap_analysis.csv"), index=False)
-
-            print(f"Saved analysis for {trial_folder}.")
-
-            # Plot logical clock drift
-            plt.figure(figsize=(10, 6))
-            plt.plot(df_vm0["System Time"], df_vm0["Logical Clock"], label="VM 0")
-            plt.plot(df_vm1["System Time"], df_vm1["Logical Clock"], label="VM 1")
-            plt.plot(df_vm2["System Time"], df_vm2["Logical Clock"], label="VM 2")
-            plt.xlabel("System Time (s)")
-            plt.ylabel("Logical Clock")
-            plt.title(f"Logical Clock Drift - {trial_folder}")
-            plt.legend()
-            plt.grid()
-            plt.savefig(os.path.join(trial_path, "logical_clock_drift.png"))  # Save figure
-            plt.close()  # Close figure to prevent memory leaks
-
-            print(f"Saved clock drift plot for {trial_folder}.")
-
-print("All trials processed successfully.")
+# Function to summarize network latency and queue wait (ms) per sender -> receiver pair
+def analyze_message_latency(vm_dataframes):
+    summaries = []
+    for vm_id, df in vm_dataframes.items():
+        if "Latency" not in df.columns:
+            continue
+        receives = df[(df["Event"] == "RECEIVE") & df["Latency"].notna()]
+        for metric in ("Latency", "Queue Wait"):
+            stats = receives.groupby("From VM")[metric].describe(percentiles=[0.5, 0.9, 0.99])
+            stats = stats.rename(columns={"count": "Count", "mean": "Mean (ms)", "50%": "P50 (ms)",
+                                          "90%": "P90 (ms)", "99%": "P99 (ms)", "max": "Max (ms)"})
+            stats = stats[["Count", "Mean (ms)", "P50 (ms)", "P90 (ms)", "P99 (ms)", "Max (ms)"]]
+            stats.insert(0, "Metric", metric)
+            stats.insert(0, "Receiver", vm_id)
+            summaries.append(stats.reset_index().rename(columns={"From VM": "Sender"}))
+    if not summaries:
+        return pd.DataFrame()
+    latency_df = pd.concat(summaries, ignore_index=True)
+    latency_df["Sender"] = latency_df["Sender"].astype(int)
+    return latency_df.sort_values(["Metric", "Sender", "Receiver"], ignore_index=True)
+
+# How far and how fast gossiped clock information travelled: Spread (ms since the origin's send) per hop count
+def analyze_gossip_spread(vm_dataframes):
+    receives = [df[(df["Event"] == "RECEIVE") & df["Hops"].notna()] for df in vm_dataframes.values()
+                if "Hops" in df.columns]
+    if not receives:
+        return pd.DataFrame()
+    receives = pd.concat(receives, ignore_index=True)
+    stats = receives.groupby("Hops")["Spread"].describe(percentiles=[0.5, 0.9])
+    stats = stats.rename(columns={"count": "Count", "mean": "Mean (ms)", "50%": "P50 (ms)", "90%": "P90 (ms)",
+                                  "max": "Max (ms)"})
+    stats = stats[["Count", "Mean (ms)", "P50 (ms)", "P90 (ms)", "Max (ms)"]].reset_index()
+    stats["Hops"] = stats["Hops"].astype(int)
+    stats["Origins Reached"] = receives.groupby("Hops")["Origin"].nunique().to_numpy()
+    return stats
+
+# Load a columnar trial table into one DataFrame per VM, shaped like parse_log output
+def load_trial_table(file_path):
+    table = read_table(file_path).to_pandas()
+    table["Event"] = table["event"].map(EVENT_NAMES)
+    table["From VM"] = table["peer"].where(table["Event"] == "RECEIVE")
+    table = table.rename(columns={"system_time": "System Time", "logical_clock": "Logical Clock",
+                                  "queue_length": "Queue Length", "latency_ms": "Latency",
+                                  "queue_wait_ms": "Queue Wait"})
+    return {vm_id: vm_df.drop(columns=["vm_id", "event", "peer"]).reset_index(drop=True)
+            for vm_id, vm_df in table.groupby("vm_id", sort=True)}
+
+# Find a trial's columnar table, if it wrote one
+def find_trial_table(trial_path):
+    for fmt in COLUMNAR_FORMATS:
+        path = trial_table_path(trial_path, fmt)
+        if os.path.exists(path):
+            return path
+    return None
+
+# Load every VM's events in a trial folder as {vm_id: DataFrame}, from the columnar table or text logs
+def load_trial_logs(trial_path):
+    table_path = find_trial_table(trial_path)
+    if table_path:
+        return load_trial_table(table_path)
+    vm_dataframes = {}
+    for name in os.listdir(trial_path):
+        match = TEXT_LOG_NAME.match(name)
+        if match and int(match.group(1)) not in vm_dataframes:
+            file_path = os.path.join(trial_path, f"machine_{match.group(1)}.log")
+            if log_segments(file_path):
+                vm_dataframes[int(match.group(1))] = parse_log(file_path)
+    return dict(sorted(vm_dataframes.items()))
+
+# Load a shared-memory clock snapshot file (one column per VM clock) into a DataFrame
+def load_clock_snapshots(file_path):
+    columns = read_snapshots(file_path)
+    return pd.DataFrame({name: np.frombuffer(column, dtype=column.typecode) for name, column in columns.items()})
+
+# Function to compute pairwise drift straight from simultaneous clock samples
+def snapshot_drift_matrix(snapshots_df):
+    clock_columns = [c for c in snapshots_df.columns if c.startswith("clock_")]
+    clocks = snapshots_df[clock_columns].to_numpy()
+    labels = [f"VM {c.split('_')[1]}" for c in clock_columns]
+    avg_drift = np.empty((len(clock_columns), len(clock_columns)))
+    max_drift = np.empty_like(avg_drift)
+    # One VM at a time keeps memory at samples x VMs instead of samples x VMs x VMs
+    for i in range(len(clock_columns)):
+        drift = np.abs(clocks - clocks[:, [i]])
+        avg_drift[i] = drift.mean(axis=0)
+        max_drift[i] = drift.max(axis=0)
+    return (pd.DataFrame(avg_drift, index=labels, columns=labels),
+            pd.DataFrame(max_drift, index=labels, columns=labels))
+
+if __name__ == "__main__":
+    # Loop through each trial folder
+    for trial_folder in sorted(os.listdir(BASE_DIR)):
+        trial_path = os.path.join(BASE_DIR, trial_folder)
+
+        if os.path.isdir(trial_path):  # Ensure it's a folder
+            print(f"Processing {trial_folder}...")
+
+            # Exact drift from shared-memory snapshots, when the trial recorded them
+            snapshot_path = os.path.join(trial_path, SNAPSHOT_FILENAME)
+            if os.path.exists(snapshot_path):
+                avg_drift_df, max_drift_df = snapshot_drift_matrix(load_clock_snapshots(snapshot_path))
+                avg_drift_df.to_csv(os.path.join(trial_path, "logical_clock_drift_matrix.csv"))
+                max_drift_df.to_csv(os.path.join(trial_path, "logical_clock_max_drift_matrix.csv"))
+                print(f"Saved snapshot drift matrices for {trial_folder}.")
+
+            # Load logs for each VM, preferring the columnar table over text logs
+            vm_dataframes = load_trial_logs(trial_path)
+            dataframes = {f"machine_{i}.log": vm_dataframes[i] for i in range(3) if i in vm_dataframes}
+
+            # Latency and queue wait per sender -> receiver, when the logs carry message timestamps
+            latency_df = analyze_message_latency(vm_dataframes)
+            if not latency_df.empty:
+                latency_df.to_csv(os.path.join(trial_path, "message_latency_analysis.csv"), index=False)
+
+            # Gossip trials: how clock information spread hop by hop, for any number of VMs
+            spread_df = analyze_gossip_spread(vm_dataframes)
+            if not spread_df.empty:
+                spread_df.to_csv(os.path.join(trial_path, "gossip_spread_analysis.csv"), index=False)
+
+            # Ensure all VMs have data
+            if len(dataframes) == 3:
+                df_vm0, df_vm1, df_vm2 = dataframes.values()
+
+                # Analyze clock jumps
+                clock_jump_analysis = [
+                    analyze_clock_jumps(df_vm0, 0),
+                    analyze_clock_jumps(df_vm1, 1),
+                    analyze_clock_jumps(df_vm2, 2)
+                ]
+                clock_jump_df = pd.DataFrame(clock_jump_analysis)
+
+                # Analyze logical clock gaps
+                clock_gap_analysis = [
+                    analyze_clock_gaps(df_vm0, 0),
+                    analyze_clock_gaps(df_vm1, 1),
+                    analyze_clock_gaps(df_vm2, 2)
+                ]
+                clock_gap_df = pd.DataFrame(clock_gap_analysis)
+
+                # Save analysis to CSV
+                clock_jump_df.to_csv(os.path.join(trial_path, "logical_clock_jump_analysis.csv"), index=False)
+                clock_gap_df.to_csv(os.path.join(trial_path, "logical_clock_gap_analysis.csv"), index=False)
+
+                print(f"Saved analysis for {trial_folder}.")
+
+                # Plot logical clock drift
+                plt.figure(figsize=(10, 6))
+                plt.plot(df_vm0["System Time"], df_vm0["Logical Clock"], label="VM 0")
+                plt.plot(df_vm1["System Time"], df_vm1["Logical Clock"], label="VM 1")
+                plt.plot(df_vm2["System Time"], df_vm2["Logical Clock"], label="VM 2")
+                plt.xlabel("System Time (s)")
+                plt.ylabel("Logical Clock")
+                plt.title(f"Logical Clock Drift - {trial_folder}")
+                plt.legend()
+                plt.grid()
+                plt.savefig(os.path.join(trial_path, "logical_clock_drift.png"))  # Save figure
+                plt.close()  # Close figure to prevent memory leaks
+
+                print(f"Saved clock drift plot for {trial_folder}.")
+
+    print("All trials processed successfully.")
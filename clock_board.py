@@ -0,0 +1,103 @@
+import array
+import json
+import multiprocessing
+import time
+
+# Each VM owns one slot of three int64 fields: version, logical clock, tick count.
+SLOT_FIELDS = 3
+SNAPSHOT_FILENAME = "clock_snapshots.clk"
+
+class ClockBoard:
+    """Lock-free shared-memory board where every VM publishes its current logical clock.
+
+    Each slot has a single writer (its VM). The version field is bumped to an odd value
+    before the write and back to even after it, so readers can retry torn reads
+    without taking a lock.
+    """
+
+    def __init__(self, num_vms, slots=None):
+        self.num_vms = num_vms
+        self.slots = slots if slots is not None else multiprocessing.RawArray('q', num_vms * SLOT_FIELDS)
+
+    def publish(self, vm_id, logical_clock, ticks):
+        """Write a VM's clock and tick count into its slot."""
+        base = vm_id * SLOT_FIELDS
+        slots = self.slots
+        slots[base] += 1            # Odd version: write in progress
+        slots[base + 1] = logical_clock
+        slots[base + 2] = ticks
+        slots[base] += 1            # Even version: slot consistent again
+
+    def read(self, vm_id):
+        """Return a consistent (logical_clock, ticks) pair for one VM."""
+        base = vm_id * SLOT_FIELDS
+        slots = self.slots
+        while True:
+            version = slots[base]
+            if version & 1:
+                continue
+            clock, ticks = slots[base + 1], slots[base + 2]
+            if slots[base] == version:
+                return clock, ticks
+
+    def snapshot(self):
+        """Return [(logical_clock, ticks), ...] for all VMs."""
+        return [self.read(vm_id) for vm_id in range(self.num_vms)]
+
+def column_names(num_vms):
+    """Column order of the snapshot file: time, then every clock, then every tick count."""
+    return (["time"] + [f"clock_{i}" for i in range(num_vms)] + [f"ticks_{i}" for i in range(num_vms)])
+
+def write_block(file, columns, num_vms):
+    """Append one block: a JSON header line followed by each column's raw bytes."""
+    header = {"num_vms": num_vms, "rows": len(columns[0]),
+              "columns": column_names(num_vms), "typecodes": [c.typecode for c in columns]}
+    file.write(json.dumps(header).encode('utf-8') + b"\n")
+    for column in columns:
+        column.tofile(file)
+
+def run_sampler(board, path, sample_rate, run_duration, block_rows=4096, start_barrier=None, start_timeout=30):
+    """Snapshot every VM's clock sample_rate times per second into a columnar file.
+
+    With start_barrier, sampling starts when the VMs pass it, so the window matches their ticks.
+    """
+    interval = 1 / sample_rate
+    num_vms = board.num_vms
+
+    def new_columns():
+        return [array.array('d')] + [array.array('q') for _ in range(2 * num_vms)]
+
+    columns = new_columns()
+    with open(path, "wb") as file:
+        if start_barrier is not None:
+            start_barrier.wait(timeout=start_timeout)
+        start_time = time.time()
+        next_sample = start_time
+        while time.time() - start_time < run_duration:
+            now = time.time()
+            columns[0].append(now)
+            for vm_id, (clock, ticks) in enumerate(board.snapshot()):
+                columns[1 + vm_id].append(clock)
+                columns[1 + num_vms + vm_id].append(ticks)
+            if len(columns[0]) >= block_rows:
+                write_block(file, columns, num_vms)
+                columns = new_columns()
+            # Schedule against the start time so sampling does not drift.
+            next_sample += interval
+            time.sleep(max(0.0, next_sample - time.time()))
+        if len(columns[0]):
+            write_block(file, columns, num_vms)
+
+def read_snapshots(path):
+    """Load a snapshot file into a dict of column name -> array."""
+    columns = {}
+    with open(path, "rb") as file:
+        while True:
+            header_line = file.readline()
+            if not header_line:
+                break
+            header = json.loads(header_line)
+            for name, typecode in zip(header["columns"], header["typecodes"]):
+                column = columns.setdefault(name, array.array(typecode))
+                column.fromfile(file, header["rows"])
+    return columns
@@ -0,0 +1,179 @@
+import argparse
+import functools
+import json
+import multiprocessing
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+
+from columnar_log import merge_trial_tables
+from distributed_simulation import (NUM_EVENT_CHOICES, STARTUP_TIMEOUT, TICK_RATE_RANGE, TRIAL_CONFIG_FILENAME,
+                                    vm_process)
+
+# Seconds the coordinator and each worker wait for every worker to report ready, unless the
+# spec sets "startup_timeout"; hosts started by hand can be minutes apart.
+CLUSTER_STARTUP_TIMEOUT = 600
+
+# Example cluster spec: every worker hosts several VMs on consecutive ports starting at "port".
+# {
+#   "config": "two-hosts",
+#   "run_duration": 60,
+#   "startup_timeout": 600,
+#   "collector": {"host": "coordinator.example", "port": 7000},
+#   "vm_options": {"transport": "tcp"},
+#   "workers": [
+#     {"host": "worker-a.example", "port": 7100, "vm_ids": [0, 1, 2]},
+#     {"host": "worker-b.example", "port": 7100, "vm_ids": [3, 4, 5]}
+#   ]
+# }
+
+def load_spec(path):
+    with open(path) as file:
+        return json.load(file)
+
+def vm_addresses(spec):
+    """Map every vm_id in the cluster to the (host, port) it listens on."""
+    addresses = {}
+    for worker in spec["workers"]:
+        for offset, vm_id in enumerate(worker["vm_ids"]):
+            addresses[vm_id] = (worker["host"], worker["port"] + offset)
+    return addresses
+
+def send_header(sock, header):
+    sock.sendall(json.dumps(header).encode('utf-8') + b"\n")
+
+def report_ready(collector, worker_index, startup_timeout=CLUSTER_STARTUP_TIMEOUT):
+    """Start barrier action: tell the coordinator this worker's VMs are bound, then wait for go."""
+    with socket.create_connection((collector["host"], collector["port"]), timeout=STARTUP_TIMEOUT) as sock:
+        send_header(sock, {"type": "ready", "worker": worker_index})
+        sock.settimeout(startup_timeout)  # The other workers may not even be started yet
+        if sock.makefile("rb").readline().strip() != b"go":
+            raise RuntimeError(f"Worker {worker_index} did not get the go signal")
+
+def ship_logs(collector, worker_index, log_dir):
+    """Send every file in log_dir to the coordinator, then report the worker done."""
+    address = (collector["host"], collector["port"])
+    for name in sorted(os.listdir(log_dir)):
+        path = os.path.join(log_dir, name)
+        with socket.create_connection(address) as sock, open(path, "rb") as file:
+            send_header(sock, {"type": "file", "worker": worker_index, "name": name,
+                               "size": os.path.getsize(path)})
+            sock.sendfile(file)
+    with socket.create_connection(address) as sock:
+        send_header(sock, {"type": "done", "worker": worker_index})
+
+def write_trial_config(spec, trial_dir):
+    """Tag the gathered trial like a local run so trial_aggregate can group it by config."""
+    vm_options = spec.get("vm_options", {})
+    config = {"config": spec.get("config", "cluster"), "num_machines": len(vm_addresses(spec)),
+              "duration": spec["run_duration"],
+              "tick_rate_range": list(vm_options.get("tick_rate_range", TICK_RATE_RANGE)),
+              "tick_rate_draw": vm_options.get("tick_rate_draw", "integer"),
+              "num_event_choices": vm_options.get("num_event_choices", NUM_EVENT_CHOICES),
+              "transport": vm_options.get("transport", "tcp"),
+              "multicast": vm_options.get("multicast", False), "log_level": vm_options.get("log_level", "full"),
+              "network_model": vm_options.get("network_model"), "num_workers": len(spec["workers"])}
+    with open(os.path.join(trial_dir, TRIAL_CONFIG_FILENAME), "w") as file:
+        json.dump(config, file, indent=2)
+
+def run_worker(spec, worker_index):
+    """Host one worker's VMs as local processes and ship their logs to the coordinator."""
+    worker = spec["workers"][worker_index]
+    addresses = vm_addresses(spec)
+    log_dir = tempfile.mkdtemp(prefix=f"cluster_worker_{worker_index}_")
+    startup_timeout = spec.get("startup_timeout", CLUSTER_STARTUP_TIMEOUT)
+    # The last local VM to bind runs the action, which holds every VM here until all workers are ready.
+    # If it fails or times out the barrier breaks, so the VMs themselves can wait without a limit.
+    start_barrier = multiprocessing.Barrier(len(worker["vm_ids"]),
+                                            action=functools.partial(report_ready, spec["collector"], worker_index,
+                                                                     startup_timeout))
+    processes = []
+    for vm_id in worker["vm_ids"]:
+        host, port = addresses[vm_id]
+        partner_info = [(pid, h, p) for pid, (h, p) in addresses.items() if pid != vm_id]
+        vm_options = dict(spec.get("vm_options", {}), log_dir=log_dir, host=worker.get("bind_host", host),
+                          advertise_host=host, port=port, start_barrier=start_barrier, startup_timeout=None,
+                          partner_info=partner_info)
+        p = multiprocessing.Process(target=vm_process, args=(vm_id, spec["run_duration"]), kwargs=vm_options)
+        p.start()
+        processes.append(p)
+    for p in processes:
+        p.join()
+    ship_logs(spec["collector"], worker_index, log_dir)
+    shutil.rmtree(log_dir)
+
+def run_coordinator(spec_path, trial_dir, local=False):
+    """Release workers together, then gather every worker's logs into trial_dir.
+
+    With local=True the workers are started here, each in its own process group,
+    standing in for separate hosts.
+    """
+    spec = load_spec(spec_path)
+    num_workers = len(spec["workers"])
+    os.makedirs(trial_dir, exist_ok=True)
+    shutil.copy(spec_path, os.path.join(trial_dir, "cluster_spec.json"))
+    write_trial_config(spec, trial_dir)
+    server = socket.create_server(('', spec["collector"]["port"]), backlog=max(128, num_workers))
+    server.settimeout(spec["run_duration"] + spec.get("startup_timeout", CLUSTER_STARTUP_TIMEOUT) + STARTUP_TIMEOUT)
+    workers = []
+    if local:
+        for worker_index in range(num_workers):
+            workers.append(subprocess.Popen([sys.executable, os.path.abspath(__file__), "worker", spec_path,
+                                             "--worker", str(worker_index)], start_new_session=True))
+    ready = []
+    done = set()
+    try:
+        while len(done) < num_workers:
+            try:
+                conn, _ = server.accept()
+            except socket.timeout:
+                raise RuntimeError(f"Timed out waiting for workers; {len(done)} of {num_workers} finished")
+            conn.settimeout(None)
+            reader = conn.makefile("rb")
+            header = json.loads(reader.readline())
+            if header["type"] == "ready":
+                ready.append(conn)  # Held open until every worker has reported
+                if len(ready) == num_workers:
+                    for ready_conn in ready:
+                        ready_conn.sendall(b"go\n")
+                        ready_conn.close()
+                    print(f"All {num_workers} workers ready.")
+                continue
+            if header["type"] == "file":
+                with open(os.path.join(trial_dir, os.path.basename(header["name"])), "wb") as file:
+                    file.write(reader.read(header["size"]))
+            elif header["type"] == "done":
+                done.add(header["worker"])
+                print(f"Worker {header['worker']} finished.")
+            conn.close()
+    finally:
+        server.close()
+        for worker in workers:
+            worker.wait()
+    vm_options = spec.get("vm_options", {})
+    if vm_options.get("log_format", "text") != "text":
+        merge_trial_tables(trial_dir, sorted(vm_addresses(spec)), vm_options.get("columnar_format", "parquet"))
+    print(f"Cluster run completed; logs gathered in {trial_dir}.")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Run the simulation across several worker processes or hosts.")
+    subparsers = parser.add_subparsers(dest="role", required=True)
+    coordinator = subparsers.add_parser("coordinator", help="Start workers together and gather their logs")
+    coordinator.add_argument("spec", help="Cluster spec JSON file")
+    coordinator.add_argument("--trial-dir", required=True, help="Directory to gather every VM's logs into")
+    coordinator.add_argument("--local", action="store_true",
+                             help="Launch every worker on this machine as its own process group")
+    worker = subparsers.add_parser("worker", help="Host the VMs assigned to one worker in the spec")
+    worker.add_argument("spec", help="Cluster spec JSON file")
+    worker.add_argument("--worker", type=int, required=True, help="Index of this worker in the spec")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.role == "coordinator":
+        run_coordinator(args.spec, args.trial_dir, local=args.local)
+    else:
+        run_worker(load_spec(args.spec), args.worker)
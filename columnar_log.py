@@ -0,0 +1,119 @@
+import array
+import os
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Only needed when columnar output is requested
+    pa = pq = None
+
+# Event type codes stored in the "event" column
+EVENT_CODES = {"INTERNAL": 0, "SEND": 1, "BROADCAST": 2, "RECEIVE": 3}
+EVENT_NAMES = {code: name for name, code in EVENT_CODES.items()}
+
+COLUMNAR_FORMATS = {"parquet": ".parquet", "arrow": ".arrow"}
+TRIAL_TABLE_BASENAME = "trial"
+
+def event_code(event_type):
+    """Map a text log event type such as 'SEND to VMs 1, 2' to its column code, or None."""
+    if event_type.startswith("SEND to VMs"):
+        return EVENT_CODES["BROADCAST"]
+    return EVENT_CODES.get(event_type.split(" ", 1)[0])
+
+def require_pyarrow():
+    if pa is None:
+        raise ImportError("Columnar trial output needs pyarrow: pip install pyarrow")
+
+def vm_table_path(directory, vm_id, fmt):
+    return os.path.join(directory, f"machine_{vm_id}{COLUMNAR_FORMATS[fmt]}")
+
+def trial_table_path(directory, fmt):
+    return os.path.join(directory, TRIAL_TABLE_BASENAME + COLUMNAR_FORMATS[fmt])
+
+class ColumnarEventLog:
+    """Accumulates one VM's events in typed arrays and flushes them as row groups."""
+
+    def __init__(self, vm_id, path, fmt="parquet", row_group_size=65536):
+        require_pyarrow()
+        self.vm_id = vm_id
+        self.path = path
+        self.fmt = fmt
+        self.row_group_size = row_group_size
+        self.writer = None
+        self.reset_columns()
+
+    def reset_columns(self):
+        self.system_time = array.array('d')
+        self.logical_clock = array.array('q')
+        self.event = array.array('b')
+        self.peer = array.array('q')
+        self.queue_length = array.array('q')
+        self.latency_ms = array.array('d')
+        self.queue_wait_ms = array.array('d')
+
+    def append(self, code, system_time, logical_clock, peer=-1, queue_length=-1,
+               latency=float("nan"), queue_wait=float("nan")):
+        """Record one event; peer and queue_length are -1 and latencies NaN when they do not apply."""
+        self.system_time.append(system_time)
+        self.logical_clock.append(logical_clock)
+        self.event.append(code)
+        self.peer.append(peer)
+        self.queue_length.append(queue_length)
+        self.latency_ms.append(latency)
+        self.queue_wait_ms.append(queue_wait)
+        if len(self.event) >= self.row_group_size:
+            self.flush()
+
+    def flush(self):
+        """Write buffered events as one row group (Parquet) or record batch (Arrow IPC)."""
+        if not len(self.event):
+            return
+        rows = len(self.event)
+        table = pa.table({
+            "vm_id": pa.array([self.vm_id] * rows, pa.int32()),
+            "event": pa.array(self.event, pa.int8()),
+            "system_time": pa.array(self.system_time, pa.float64()),
+            "logical_clock": pa.array(self.logical_clock, pa.int64()),
+            "peer": pa.array(self.peer, pa.int64()),
+            "queue_length": pa.array(self.queue_length, pa.int64()),
+            "latency_ms": pa.array(self.latency_ms, pa.float64()),
+            "queue_wait_ms": pa.array(self.queue_wait_ms, pa.float64()),
+        })
+        if self.writer is None:
+            if self.fmt == "arrow":
+                self.writer = pa.ipc.new_file(self.path, table.schema)
+            else:
+                self.writer = pq.ParquetWriter(self.path, table.schema)
+        self.writer.write_table(table)
+        self.reset_columns()
+
+    def close(self):
+        self.flush()
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+def read_table(path):
+    """Read a Parquet or Arrow IPC file written by ColumnarEventLog."""
+    require_pyarrow()
+    if path.endswith(COLUMNAR_FORMATS["arrow"]):
+        with pa.OSFile(path) as source:
+            return pa.ipc.open_file(source).read_all()
+    return pq.read_table(path)
+
+def merge_trial_tables(directory, vm_ids, fmt="parquet"):
+    """Combine the per-VM files of a trial into one table with a vm_id column."""
+    parts = [vm_table_path(directory, vm_id, fmt) for vm_id in vm_ids]
+    parts = [path for path in parts if os.path.exists(path)]
+    if not parts:
+        return None
+    table = pa.concat_tables([read_table(path) for path in parts])
+    path = trial_table_path(directory, fmt)
+    if fmt == "arrow":
+        with pa.ipc.new_file(path, table.schema) as writer:
+            writer.write_table(table)
+    else:
+        pq.write_table(table, path)
+    for part in parts:
+        os.remove(part)
+    return path
@@ -2,32 +2,174 @@ import multiprocessing
 import threading
 import socket
 import json
-import queue
+import math
 import random
+import select
+import struct
 import time
+import argparse
+import os
+import tempfile
+from clock_board import ClockBoard, SNAPSHOT_FILENAME, run_sampler
+from log_rotation import COMPRESSION_SUFFIXES, RotatingLogWriter
+from network_emulation import NetworkEmulator
+from adaptive_control import AdaptiveController
+from message_inbox import MessageInbox
+from gossip import PeerView
+from tick_profiler import DEQUEUE, LOG, PROCESS, SEND, SLEEP, TickProfiler
+from columnar_log import COLUMNAR_FORMATS, EVENT_CODES, ColumnarEventLog, event_code, merge_trial_tables, vm_table_path
 
 # Base port for the machines
 BASE_PORT = 6000
 NUM_MACHINES = 3
 
+# Each VM draws its tick rate from this range; events 1-3 of 1..NUM_EVENT_CHOICES are sends.
+# The less_internal variant uses 4 event choices; small_variation draws a uniform rate in (2, 3).
+TICK_RATE_RANGE = (1, 6)
+NUM_EVENT_CHOICES = 10
+TICK_RATE_DRAWS = ("integer", "uniform")
+
+# Config tags written next to each run's logs for cross-trial aggregation
+TRIAL_CONFIG_FILENAME = "trial_config.json"
+
+# Loopback multicast group used by the UDP transport for broadcast events. The driver gives
+# every run its own port so concurrent runs on one host do not hear each other's broadcasts.
+MULTICAST_GROUP = "239.255.26.20"
+MULTICAST_PORT = 5999
+
+# Clock jumps above this count as large in aggregate log windows
+LARGE_JUMP = 2
+
+# Seconds a VM waits at the startup barrier for the others to bind
+STARTUP_TIMEOUT = 30
+
+class PortRegistry:
+    """Shared-memory map of vm_id -> (host, port) for VMs that bind dynamic ports on one host."""
+
+    def __init__(self, num_vms, host='localhost'):
+        self.host = host
+        self.ports = multiprocessing.RawArray('i', num_vms)
+
+    def __setitem__(self, vm_id, address):
+        self.ports[vm_id] = address[1]
+
+    def __getitem__(self, vm_id):
+        return (self.host, self.ports[vm_id])
+
+def free_udp_port():
+    """Ask the OS for a UDP port that is free right now."""
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.bind(('', 0))
+        return sock.getsockname()[1]
+
 class VirtualMachine:
-    def __init__(self, vm_id, tick_rate, partner_info, run_duration):
+    def __init__(self, vm_id, tick_rate, partner_info, run_duration, transport="tcp", multicast=False,
+                 multicast_port=MULTICAST_PORT,
+                 clock_board=None, log_format="text", columnar_format="parquet",
+                 log_dir=".", log_max_bytes=0, log_max_seconds=0, log_compression=None,
+                 host='localhost', port=None, registry=None, start_barrier=None, network_model=None,
+                 log_level="full", internal_sample_every=10, aggregate_window=1.0, profile=False,
+                 profile_ticks=65536, adaptive=None, gossip=None, startup_timeout=STARTUP_TIMEOUT,
+                 num_event_choices=NUM_EVENT_CHOICES, advertise_host=None, seed=None):
         self.vm_id = vm_id
         self.tick_rate = tick_rate              # Ticks per second
         self.partner_info = partner_info        # List of (partner_id, host, port) tuples
         self.run_duration = run_duration
+        self.transport = transport              # "tcp" or "udp"
+        self.multicast = multicast              # Broadcast via loopback multicast (UDP only)
+        self.multicast_port = multicast_port    # Shared by the VMs of one run only
+        self.clock_board = clock_board          # Shared-memory board to publish clocks on, if any
         self.logical_clock = 0
-        self.message_queue = queue.Queue()
-        self.log_filename = f"machine_{self.vm_id}.log"
+        self.ticks = 0
+        self.num_event_choices = num_event_choices  # Events 1-3 of 1..num_event_choices are sends
+        self.rng = random.Random(seed)          # Draws the random events; a seed makes this VM's mix repeatable
+        self.tick_loop_seconds = 0.0            # Measured length of the tick loop, for achieved tick rates
+        self.message_queue = MessageInbox()
+        self.log_dir = log_dir
+        self.log_filename = os.path.join(log_dir, f"machine_{self.vm_id}.log")
+        self.log_format = log_format            # "text", "columnar" or "both"
+        self.log_rotation = {"max_bytes": log_max_bytes, "max_seconds": log_max_seconds,
+                             "compression": log_compression}
+        self.log_writer = None                  # Opened on the first text event
+        self.log_level = log_level              # "full", "sampled" or "aggregate" text logging
+        self.internal_sample_every = internal_sample_every
+        self.aggregate_window = aggregate_window  # Seconds per WINDOW line in aggregate mode
+        self.internal_seen = 0
+        self.skipped_internal = 0
+        self.last_skipped = None
+        self.previous_clock = None
+        self.window = {}
+        self.columnar_log = None
+        if log_format in ("columnar", "both"):
+            self.columnar_log = ColumnarEventLog(vm_id, vm_table_path(log_dir, vm_id, columnar_format), columnar_format)
+        self.host = host
+        self.advertise_host = advertise_host    # Address peers reach us at, when host is a bind address
+        self.port = BASE_PORT + vm_id if port is None else port  # 0 lets the OS pick a free port
+        self.registry = registry                # Shared vm_id -> (host, port) map for dynamic ports
+        self.start_barrier = start_barrier      # All VMs wait here before their first tick
+        self.startup_timeout = startup_timeout  # Seconds to wait there; None waits as long as it takes
+        # Emulated latency/jitter/loss on outgoing links, built from a network model dict
+        self.network = NetworkEmulator.from_config(network_model, vm_id) if network_model else None
+        # Per-phase tick timings, dumped next to the logs at shutdown
+        self.profiler = TickProfiler(profile_ticks, 1 / tick_rate) if profile else None
+        # Backlog controller built from a dict of AdaptiveController options, if enabled
+        self.controller = AdaptiveController(**adaptive) if adaptive is not None else None
+        self.last_queue_wait = float("nan")     # Queue wait (ms) of the last processed message
+        # Slowdown requested by a backlogged peer: (until, factor, sender); set by the listener
+        self.slowdown = None
+        self.logged_slowdown = None
+        # Gossip mode: PeerView options; the view itself is built once partner addresses are known
+        self.gossip = gossip
+        self.peer_view = None
+        self.provenance = None                  # (origin, origin_time, hops) behind our clock; None when our own
         self.stop_event = threading.Event()
         self.server_socket = None
+        self.udp_socket = None
+        self.multicast_socket = None
+        # Per-link sequence numbers so receivers can count lost and reordered datagrams.
+        self.send_seq = {}
+        self.recv_seq = {}
+        self.transport_stats = {"sent": 0, "received": 0, "lost": 0, "reordered": 0}
+        # Listener, per-connection and network emulator threads all update the counters above.
+        self.stats_lock = threading.Lock()
+
+    def open_udp_socket(self):
+        """Create the VM's single UDP socket (and multicast receiver, if enabled)."""
+        if self.udp_socket is None:
+            self.udp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self.udp_socket.bind((self.host, self.port))
+            self.port = self.udp_socket.getsockname()[1]
+            if self.multicast:
+                self.udp_socket.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_IF, socket.inet_aton('127.0.0.1'))
+                self.udp_socket.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_LOOP, 1)
+                self.udp_socket.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, 1)
+                self.multicast_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+                self.multicast_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+                if hasattr(socket, "SO_REUSEPORT"):
+                    self.multicast_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+                self.multicast_socket.bind(('', self.multicast_port))
+                membership = struct.pack("4s4s", socket.inet_aton(MULTICAST_GROUP), socket.inet_aton('127.0.0.1'))
+                self.multicast_socket.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, membership)
+        return self.udp_socket
+
+    def bind(self):
+        """Bind the VM's listening socket and return the port it actually got."""
+        if self.transport == "udp":
+            self.open_udp_socket()
+        elif self.server_socket is None:
+            self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self.server_socket.bind((self.host, self.port))
+            self.server_socket.listen(128)
+            self.server_socket.settimeout(1.0)  # Use timeout to periodically check for stop_event
+            self.port = self.server_socket.getsockname()[1]
+        return self.port
 
     def start_listener(self):
         """Set up a server socket and listen for incoming messages."""
-        self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.server_socket.bind(('localhost', BASE_PORT + self.vm_id))
-        self.server_socket.listen(5)
-        self.server_socket.settimeout(1.0)  # Use timeout to periodically check for stop_event
+        if self.transport == "udp":
+            self.receive_datagrams()
+            return
+        self.bind()
         while not self.stop_event.is_set():
             try:
                 conn, addr = self.server_socket.accept()
@@ -36,6 +178,70 @@ class VirtualMachine:
                 continue
         self.server_socket.close()
 
+    def receive_datagrams(self):
+        """Read datagrams from the UDP (and multicast) sockets until stopped."""
+        self.open_udp_socket()
+        sockets = [self.udp_socket]
+        if self.multicast_socket is not None:
+            sockets.append(self.multicast_socket)
+        while not self.stop_event.is_set():
+            readable, _, _ = select.select(sockets, [], [], 1.0)
+            for sock in readable:
+                try:
+                    data, addr = sock.recvfrom(65535)
+                    message = json.loads(data.decode('utf-8'))
+                except Exception as e:
+                    print(f"VM {self.vm_id} error reading datagram: {e}")
+                    continue
+                if message.get("sender") == self.vm_id:
+                    continue  # Our own multicast looped back
+                self.enqueue(message)
+        if self.multicast_socket is not None:
+            self.multicast_socket.close()
+        self.udp_socket.close()
+
+    def enqueue(self, message):
+        """Stamp an arriving message with its enqueue time and add it to the message queue."""
+        message["enqueued_at"] = time.monotonic()
+        self.record_arrival(message)
+        if message.get("type") == "slowdown":
+            # Control messages skip the queue and never touch the logical clock.
+            self.slowdown = (message["enqueued_at"] + message["duration"], message["factor"], message["sender"])
+            return
+        if message.get("type") == "shuffle":
+            if self.peer_view is not None:
+                self.peer_view.receive_shuffle(message["peers"])
+            return
+        self.message_queue.put(message)
+
+    def record_arrival(self, message):
+        """Update loss/reorder counters from a message's per-link sequence number."""
+        with self.stats_lock:
+            self.transport_stats["received"] += 1
+            if "seq" not in message:
+                return
+            key = (message.get("sender"), message.get("mcast", False))
+            seq = message["seq"]
+            last = self.recv_seq.get(key, -1)
+            if seq > last:
+                self.transport_stats["lost"] += seq - last - 1
+                self.recv_seq[key] = seq
+            else:
+                # A datagram we counted as lost arrived late.
+                self.transport_stats["reordered"] += 1
+                self.transport_stats["lost"] -= 1
+
+    def count_sent(self):
+        with self.stats_lock:
+            self.transport_stats["sent"] += 1
+
+    def stamp_message(self, message, link):
+        """Return a copy of message carrying the next sequence number for link and its send time."""
+        seq = self.send_seq.get(link, 0)
+        self.send_seq[link] = seq + 1
+        # Monotonic time is shared by every process on a host, so receivers can subtract it.
+        return dict(message, seq=seq, sent_at=time.monotonic())
+
     def handle_client(self, conn):
         """Handle incoming connection, read data, and enqueue the message."""
         try:
@@ -47,76 +253,338 @@ class VirtualMachine:
                 data += chunk
             if data:
                 message = json.loads(data.decode('utf-8'))
-                self.message_queue.put(message)
+                self.enqueue(message)
         except Exception as e:
             print(f"VM {self.vm_id} error handling client: {e}")
         finally:
             conn.close()
 
-    def send_message(self, partner_host, partner_port, message):
+    def send_message(self, partner_host, partner_port, message, partner_id=None):
         """Connect to a partner's server socket and send a JSON message."""
+        message = self.stamp_message(message, (partner_host, partner_port))
+        payload = json.dumps(message).encode('utf-8')
+        if self.network is not None:
+            # The emulated link decides when (and whether) the message reaches the socket.
+            self.network.submit(self.vm_id, partner_id, len(payload), self.transmit, partner_host, partner_port, payload)
+        else:
+            self.transmit(partner_host, partner_port, payload)
+
+    def transmit(self, partner_host, partner_port, payload):
+        """Put an encoded message on the wire."""
         try:
-            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-                s.connect((partner_host, partner_port))
-                s.sendall(json.dumps(message).encode('utf-8'))
+            if self.transport == "udp":
+                self.open_udp_socket().sendto(payload, (partner_host, partner_port))
+            else:
+                with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+                    s.connect((partner_host, partner_port))
+                    s.sendall(payload)
+            self.count_sent()
         except Exception as e:
             print(f"VM {self.vm_id} failed to send message: {e}")
 
-    def log_event(self, event_type, system_time, additional_info=""):
-        """Log an event to the machine's log file."""
+    def broadcast_message(self, partners, message):
+        """Send one message to every (partner_id, host, port) in partners."""
+        if self.transport != "udp" or self.network is not None:
+            for partner_id, host, port in partners:
+                self.send_message(host, port, message, partner_id)
+            return
+        sock = self.open_udp_socket()
+        try:
+            if self.multicast:
+                # One datagram reaches every partner that joined the group.
+                payload = json.dumps(self.stamp_message(dict(message, mcast=True), "mcast")).encode('utf-8')
+                sock.sendto(payload, (MULTICAST_GROUP, self.multicast_port))
+                self.count_sent()
+                return
+            # Encode every datagram up front, then push them out back to back on one socket.
+            batch = [(json.dumps(self.stamp_message(message, (host, port))).encode('utf-8'), (host, port))
+                     for partner_id, host, port in partners]
+            for payload, address in batch:
+                sock.sendto(payload, address)
+                self.count_sent()
+        except Exception as e:
+            print(f"VM {self.vm_id} failed to send message: {e}")
+
+    def log_event(self, event_type, system_time, additional_info="", peer=-1, queue_length=-1,
+                  latency=float("nan"), queue_wait=float("nan")):
+        """Log an event to the machine's log file and/or columnar event table."""
+        if self.profiler is None:
+            self.record_event(event_type, system_time, additional_info, peer, queue_length, latency, queue_wait)
+            return
+        log_start = time.perf_counter_ns()
+        self.record_event(event_type, system_time, additional_info, peer, queue_length, latency, queue_wait)
+        self.profiler.add(LOG, time.perf_counter_ns() - log_start)
+
+    def record_event(self, event_type, system_time, additional_info, peer, queue_length, latency, queue_wait):
+        """Write an event to whichever log outputs and log level are configured."""
+        code = event_code(event_type)
+        if self.columnar_log is not None and code is not None:
+            self.columnar_log.append(code, system_time, self.logical_clock, peer, queue_length,
+                                     latency, queue_wait)
+            if self.log_format == "columnar":
+                return  # Lines with no column code (TRANSPORT, ADAPT) still go to the text log
+        if code is None or self.log_level == "full":
+            self.flush_pending()  # Keep summary lines after the events they follow
+            self.write_log_line(event_type, system_time, additional_info)
+        elif self.log_level == "sampled":
+            self.log_sampled(event_type, system_time, additional_info)
+        else:
+            self.log_aggregate(code, system_time, queue_length)
+
+    def write_log_line(self, event_type, system_time, additional_info="", logical_clock=None):
+        """Append one line to the machine's text log."""
+        if logical_clock is None:
+            logical_clock = self.logical_clock
         log_line = (f"{event_type} | System Time: {system_time:.4f} | "
-                    f"Logical Clock: {self.logical_clock} | {additional_info}\n")
-        with open(self.log_filename, "a") as log_file:
-            log_file.write(log_line)
+                    f"Logical Clock: {logical_clock} | {additional_info}\n")
+        if self.log_writer is None or self.log_writer.path != self.log_filename:
+            self.close_text_log()  # Only the text log; the columnar table stays open
+            self.log_writer = RotatingLogWriter(self.log_filename, **self.log_rotation)
+        self.log_writer.write(log_line)
+
+    def log_sampled(self, event_type, system_time, additional_info):
+        """Log every SEND/RECEIVE but only every k-th INTERNAL, noting how many were skipped."""
+        if event_type == "INTERNAL":
+            self.internal_seen += 1
+            # The first INTERNAL is always logged so the log starts from the true initial clock.
+            if (self.internal_seen - 1) % self.internal_sample_every:
+                self.skipped_internal += 1
+                self.last_skipped = (system_time, self.logical_clock)
+                return
+        if self.skipped_internal:
+            # Skipped events each advanced the clock by 1; analysis subtracts them from this line's jump.
+            additional_info += (", " if additional_info else "") + f"Skipped Internal: {self.skipped_internal}"
+            self.skipped_internal = 0
+        self.write_log_line(event_type, system_time, additional_info)
+
+    def log_aggregate(self, code, system_time, queue_length):
+        """Fold an event into the current window, writing the window out once it has elapsed."""
+        window = self.window
+        if window and system_time >= window["start"] + self.aggregate_window:
+            self.flush_window()
+            window = self.window
+        jump = 0 if self.previous_clock is None else self.logical_clock - self.previous_clock
+        self.previous_clock = self.logical_clock
+        if not window:
+            window.update(start=system_time, events=0, internal=0, sends=0, receives=0, advance=0,
+                          clock_min=self.logical_clock, max_jump=jump, min_jump=jump, large_jumps=0, max_queue=0)
+        window["events"] += 1
+        if code == EVENT_CODES["INTERNAL"]:
+            window["internal"] += 1
+        elif code == EVENT_CODES["RECEIVE"]:
+            window["receives"] += 1
+        else:
+            window["sends"] += 1
+        window["advance"] += jump
+        window["clock_min"] = min(window["clock_min"], self.logical_clock)
+        window["max_jump"] = max(window["max_jump"], jump)
+        window["min_jump"] = min(window["min_jump"], jump)
+        window["large_jumps"] += jump > LARGE_JUMP
+        window["max_queue"] = max(window["max_queue"], queue_length)
+        window["end"] = system_time
+        window["clock"] = self.logical_clock
+
+    def flush_pending(self):
+        """Write out whatever sampled or aggregate logging is still holding back."""
+        if self.skipped_internal:
+            # Log the last skipped INTERNAL event so the trailing ones are still accounted for.
+            system_time, logical_clock = self.last_skipped
+            self.skipped_internal -= 1
+            info = f"Skipped Internal: {self.skipped_internal}" if self.skipped_internal else ""
+            self.skipped_internal = 0
+            self.write_log_line("INTERNAL", system_time, info, logical_clock=logical_clock)
+        self.flush_window()
 
-    def process_message(self, message, system_time):
-        """Process a received message and update the logical clock."""
+    def flush_window(self):
+        """Write the pending aggregate window, if any, as one WINDOW line."""
+        window = self.window
+        if not window:
+            return
+        self.write_log_line("WINDOW", window["end"],
+                            f"Events: {window['events']}, Internal: {window['internal']}, "
+                            f"Sends: {window['sends']}, Receives: {window['receives']}, "
+                            f"Clock Advance: {window['advance']}, Clock Min: {window['clock_min']}, "
+                            f"Clock Max: {window['clock']}, Max Jump: {window['max_jump']}, "
+                            f"Min Jump: {window['min_jump']}, Large Jumps: {window['large_jumps']}, "
+                            f"Max Queue: {window['max_queue']}", logical_clock=window["clock"])
+        window.clear()
+
+    def close_text_log(self):
+        """Close the current text log writer, waiting for its segment compression."""
+        if self.log_writer is not None:
+            self.log_writer.close()
+            self.log_writer = None
+
+    def close_logs(self):
+        """Flush and close the text log (waiting for segment compression) and columnar table."""
+        self.flush_pending()
+        self.close_text_log()
+        if self.columnar_log is not None:
+            self.columnar_log.close()
+
+    def process_message(self, message, system_time, q_len=None):
+        """Process a received message and update the logical clock.
+
+        q_len is the queue length left behind this message, when the caller already knows it.
+        """
         received_clock = message.get("clock", 0)
+        if "origin" in message:
+            # Gossip provenance: carry the message's chain on if its clock wins, else the clock is ours again.
+            hops = message["hops"] + 1
+            dominated = received_clock >= self.logical_clock
+            self.provenance = (message["origin"], message["origin_time"], hops) if dominated else None
         self.logical_clock = max(self.logical_clock, received_clock) + 1
+        if q_len is None:
+            q_len = self.message_queue.qsize()
+        info = f"From VM {message.get('sender')}, Queue Length: {q_len}"
+        if "origin" in message:
+            spread = (system_time - message["origin_time"]) * 1000
+            info += f", Origin: {message['origin']}, Hops: {hops}, Spread: {spread:.3f} ms"
+        latency = queue_wait = float("nan")
+        if "enqueued_at" in message:
+            queue_wait = (time.monotonic() - message["enqueued_at"]) * 1000
+            info += f", Queue Wait: {queue_wait:.3f} ms"
+            if "sent_at" in message:
+                latency = (message["enqueued_at"] - message["sent_at"]) * 1000
+                info += f", Latency: {latency:.3f} ms"
+        self.last_queue_wait = queue_wait
+        self.log_event("RECEIVE", system_time, info, peer=message.get("sender", -1), queue_length=q_len,
+                       latency=latency, queue_wait=queue_wait)
+
+    def adapt(self, system_time):
+        """Let the controller react to the backlog, then drain the extra messages it allows."""
+        controller = self.controller
         q_len = self.message_queue.qsize()
-        self.log_event("RECEIVE", system_time, f"From VM {message.get('sender')}, Queue Length: {q_len}")
+        queue_wait = 0.0 if math.isnan(self.last_queue_wait) else self.last_queue_wait
+        changed, signal = controller.update(q_len, queue_wait, time.monotonic())
+        if changed:
+            self.log_event("ADAPT", system_time,
+                           f"Action: Extra Dequeues, Count: {controller.extra_dequeues}, "
+                           f"Queue Length: {q_len}, Queue Wait: {queue_wait:.3f} ms")
+        if signal and self.partner_info:
+            message = controller.slowdown_message(self.vm_id)
+            for partner_id, host, port in self.partner_info:
+                self.send_message(host, port, message, partner_id)
+            partner_ids = ", ".join(str(p[0]) for p in self.partner_info)
+            self.log_event("ADAPT", system_time,
+                           f"Action: Slowdown Sent, To VMs: {partner_ids}, Factor: {controller.slowdown_factor}, "
+                           f"Duration: {controller.slowdown_duration}")
+        batch = self.message_queue.drain(controller.extra_dequeues)
+        remaining = self.message_queue.qsize() + len(batch)
+        for message in batch:
+            remaining -= 1
+            self.process_message(message, time.time(), remaining)
+
+    def gossip_send(self, system_time):
+        """Send the clock to this event's fanout peers from the gossip view, with its provenance."""
+        targets = self.peer_view.targets()
+        if not targets:
+            return
+        origin, origin_time, hops = self.provenance or (self.vm_id, system_time, 0)
+        msg = {"sender": self.vm_id, "clock": self.logical_clock, "origin": origin, "origin_time": origin_time,
+               "hops": hops}
+        for partner_id, host, port in targets:
+            self.send_message(host, port, msg, partner_id)
+        self.logical_clock += 1
+        partner_ids = ", ".join(str(target[0]) for target in targets)
+        if len(targets) == 1:
+            self.log_event("SEND to VM " + partner_ids, system_time, f"Message Clock Sent: {msg['clock']}",
+                           peer=targets[0][0])
+        else:
+            self.log_event("SEND to VMs " + partner_ids, system_time, f"Message Clock Sent: {msg['clock']}")
+
+    def advertised_address(self):
+        """Where peers should reach this VM: the registry's or spec's address rather than the bind address."""
+        if self.registry is not None:
+            return self.registry[self.vm_id]
+        return (self.advertise_host or self.host, self.port)
+
+    def gossip_tick(self):
+        """Merge shuffled-in peers and, every shuffle_every ticks, shuffle part of the view with a peer."""
+        view = self.peer_view
+        view.apply_pending()
+        if view.shuffle_every and self.ticks % view.shuffle_every == 0:
+            shuffle = view.shuffle((self.vm_id, *self.advertised_address()))
+            if shuffle is not None:
+                (partner_id, host, port), entries = shuffle
+                self.send_message(host, port, {"sender": self.vm_id, "type": "shuffle", "peers": entries}, partner_id)
+
+    def tick_interval(self, system_time):
+        """Seconds to sleep this tick, stretched while a peer has asked us to slow down."""
+        slowdown = self.slowdown
+        if slowdown is None or time.monotonic() >= slowdown[0]:
+            return 1 / self.tick_rate
+        if slowdown is not self.logged_slowdown:
+            self.logged_slowdown = slowdown
+            self.log_event("ADAPT", system_time,
+                           f"Action: Slowdown Received, From VM: {slowdown[2]}, Factor: {slowdown[1]}")
+        return slowdown[1] / self.tick_rate
 
     def run(self):
         """Main loop: process incoming messages or perform events on each tick."""
+        # Bind before ticking so early messages are not refused, and publish where we listen.
+        self.bind()
+        if self.registry is not None:
+            self.registry[self.vm_id] = (self.host, self.port)
         # Start listener thread for incoming socket connections.
         listener_thread = threading.Thread(target=self.start_listener, daemon=True)
         listener_thread.start()
+        if self.start_barrier is not None:
+            self.start_barrier.wait(timeout=self.startup_timeout)
+        if self.registry is not None:
+            # Every VM has registered by now, so partner addresses can be resolved.
+            self.partner_info = [(pid, *self.registry[pid]) for pid, _, _ in self.partner_info]
+        if self.gossip is not None:
+            self.peer_view = PeerView(self.vm_id, self.partner_info, **self.gossip)
+        if self.network is not None:
+            self.network.start()
 
+        profiler = self.profiler
+        if profiler is not None:
+            profiler.start_tick()
         start_time = time.time()
         while time.time() - start_time < self.run_duration:
             system_time = time.time()
-            if not self.message_queue.empty():
-                try:
-                    message = self.message_queue.get_nowait()
-                    self.process_message(message, system_time)
-                except queue.Empty:
-                    pass
+            phase = PROCESS
+            message, q_len = self.message_queue.pop()
+            if message is not None:
+                if profiler is not None:
+                    profiler.mark(DEQUEUE)
+                self.process_message(message, system_time, q_len)
+                if self.controller is not None:
+                    self.adapt(system_time)
             else:
-                event_choice = random.randint(1, 10)
-                if event_choice == 1:
+                if profiler is not None:
+                    profiler.mark(DEQUEUE)
+                event_choice = self.rng.randint(1, self.num_event_choices)
+                if event_choice <= 3:
+                    phase = SEND
+                if event_choice <= 3 and self.peer_view is not None:
+                    # Gossip mode: every send event goes to fanout peers from the view.
+                    self.gossip_send(system_time)
+                elif event_choice == 1:
                     # Send to first partner, if available.
                     if self.partner_info:
                         partner_id, host, port = self.partner_info[0]
                         msg = {"sender": self.vm_id, "clock": self.logical_clock}
-                        self.send_message(host, port, msg)
+                        self.send_message(host, port, msg, partner_id)
                         self.logical_clock += 1
                         self.log_event("SEND to VM " + str(partner_id), system_time,
-                                       f"Message Clock Sent: {msg['clock']}")
+                                       f"Message Clock Sent: {msg['clock']}", peer=partner_id)
                 elif event_choice == 2:
                     # Send to second partner, if available.
                     if len(self.partner_info) > 1:
                         partner_id, host, port = self.partner_info[1]
                         msg = {"sender": self.vm_id, "clock": self.logical_clock}
-                        self.send_message(host, port, msg)
+                        self.send_message(host, port, msg, partner_id)
                         self.logical_clock += 1
                         self.log_event("SEND to VM " + str(partner_id), system_time,
-                                       f"Message Clock Sent: {msg['clock']}")
+                                       f"Message Clock Sent: {msg['clock']}", peer=partner_id)
                 elif event_choice == 3:
                     # Send to all partners.
                     if self.partner_info:
-                        for partner_id, host, port in self.partner_info:
-                            msg = {"sender": self.vm_id, "clock": self.logical_clock}
-                            self.send_message(host, port, msg)
+                        msg = {"sender": self.vm_id, "clock": self.logical_clock}
+                        self.broadcast_message(self.partner_info, msg)
                         self.logical_clock += 1
                         partner_ids = ", ".join(str(p[0]) for p in self.partner_info)
                         self.log_event("SEND to VMs " + partner_ids, system_time,
@@ -125,29 +593,210 @@ class VirtualMachine:
                     # Internal event.
                     self.logical_clock += 1
                     self.log_event("INTERNAL", system_time)
-            time.sleep(1 / self.tick_rate)
+            self.ticks += 1
+            if self.peer_view is not None:
+                self.gossip_tick()
+            if self.clock_board is not None:
+                self.clock_board.publish(self.vm_id, self.logical_clock, self.ticks)
+            if profiler is not None:
+                profiler.mark(phase)
+            time.sleep(self.tick_interval(system_time))
+            if profiler is not None:
+                profiler.mark(SLEEP)
+                profiler.end_tick()
+
+        self.tick_loop_seconds = time.time() - start_time
 
         # Signal listener thread to stop and wait for it to finish.
+        transport_info = ""
+        if self.network is not None:
+            network_stats = self.network.stop()
+            transport_info = (f", Emulated Drops: {network_stats['dropped']}, "
+                              f"Undelivered: {network_stats['undelivered']}")
         self.stop_event.set()
         listener_thread.join()
+        with self.stats_lock:
+            stats = dict(self.transport_stats)
+        self.log_event("TRANSPORT", time.time(),
+                       f"Transport: {self.transport}, Sent: {stats['sent']}, Received: {stats['received']}, "
+                       f"Lost: {stats['lost']}, Reordered: {stats['reordered']}{transport_info}")
+        self.close_logs()
+        if profiler is not None:
+            profile_base = os.path.join(self.log_dir, f"machine_{self.vm_id}")
+            profiler.write_summary(profile_base + ".profile.txt", self.vm_id)
+            profiler.write_folded(profile_base + ".folded", self.vm_id)
 
-def vm_process(vm_id, run_duration):
+def vm_process(vm_id, run_duration, partner_info=None, num_machines=NUM_MACHINES, tick_rate_range=TICK_RATE_RANGE,
+               tick_rate_draw="integer", **vm_options):
     """Process target for each Virtual Machine."""
-    tick_rate = random.randint(1, 6)
-    # Prepare partner info: (partner_id, host, port) for every other VM.
-    partner_info = [(pid, 'localhost', BASE_PORT + pid) for pid in range(NUM_MACHINES) if pid != vm_id]
-    vm = VirtualMachine(vm_id, tick_rate, partner_info, run_duration)
-    print(f"VM {vm_id} starting with tick rate {tick_rate} ticks/sec, listening on port {BASE_PORT + vm_id}.")
+    if tick_rate_draw == "uniform":
+        tick_rate = random.uniform(*tick_rate_range)
+    else:
+        tick_rate = random.randint(*map(int, tick_rate_range))
+    if partner_info is None:
+        # Prepare partner info: (partner_id, host, port) for every other VM.
+        partner_ids = range(num_machines)
+        if vm_options.get("gossip") is not None:
+            # Gossip VMs start from a random sample instead of the full membership.
+            view_size = vm_options["gossip"].get("view_size", 8)
+            partner_ids = [pid for pid in random.sample(partner_ids, min(view_size + 1, num_machines))
+                           if pid != vm_id][:view_size]
+        partner_info = [(pid, 'localhost', BASE_PORT + pid) for pid in partner_ids if pid != vm_id]
+    vm = VirtualMachine(vm_id, tick_rate, partner_info, run_duration, **vm_options)
+    vm.bind()
+    print(f"VM {vm_id} starting with tick rate {tick_rate} ticks/sec, listening on port {vm.port}.")
     vm.run()
     print(f"VM {vm_id} finished.")
 
+def create_log_dir(log_dir=None, runs_dir="runs"):
+    """Return the run's log directory: log_dir if given, else a fresh runs/run_<timestamp>_<suffix>.
+
+    The unique suffix keeps runs started in the same second from appending onto each other's logs,
+    and a given log_dir that already holds a trial is refused for the same reason.
+    """
+    if log_dir is not None:
+        os.makedirs(log_dir, exist_ok=True)
+        if any(name.startswith("machine_") or name == TRIAL_CONFIG_FILENAME for name in os.listdir(log_dir)):
+            raise FileExistsError(f"{log_dir} already holds a trial's logs; pick a new --log-dir")
+        return log_dir
+    os.makedirs(runs_dir, exist_ok=True)
+    return tempfile.mkdtemp(prefix=time.strftime("run_%Y%m%d_%H%M%S_"), dir=runs_dir)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Run the distributed logical clock simulation.")
+    parser.add_argument("--duration", type=float, default=60, help="Seconds to run the simulation")
+    parser.add_argument("--config-name", default="default",
+                        help="Label recorded with this run so trials can be aggregated per configuration")
+    parser.add_argument("--transport", choices=["tcp", "udp"], default="tcp",
+                        help="Carry messages over a TCP connection per message or UDP datagrams")
+    parser.add_argument("--multicast", action="store_true",
+                        help="With --transport udp, send broadcast events to a loopback multicast group")
+    parser.add_argument("--sample-rate", type=float, default=0,
+                        help="Snapshot all clocks from shared memory this many times per second (0 disables)")
+    parser.add_argument("--log-format", choices=["text", "columnar", "both"], default="text",
+                        help="Write text logs, one columnar trial table (plus TRANSPORT/ADAPT lines as text), or both")
+    parser.add_argument("--columnar-format", choices=sorted(COLUMNAR_FORMATS), default="parquet",
+                        help="File format of the columnar trial table")
+    parser.add_argument("--log-level", choices=["full", "sampled", "aggregate"], default="full",
+                        help="Log every event, SEND/RECEIVE plus every k-th INTERNAL, or per-window aggregates")
+    parser.add_argument("--internal-sample-every", type=int, default=10,
+                        help="With --log-level sampled, log one INTERNAL event in this many")
+    parser.add_argument("--aggregate-window", type=float, default=1.0,
+                        help="With --log-level aggregate, seconds covered by each WINDOW line")
+    parser.add_argument("--profile", action="store_true",
+                        help="Record per-phase tick timings and write a summary and folded profile per VM")
+    parser.add_argument("--profile-ticks", type=int, default=65536,
+                        help="Number of most recent ticks the profiler keeps")
+    parser.add_argument("--log-dir", default=None,
+                        help="Directory for this run's logs (default: a fresh runs/run_<timestamp> directory)")
+    parser.add_argument("--log-max-bytes", type=int, default=0,
+                        help="Rotate a text log once its active segment reaches this size (0 disables)")
+    parser.add_argument("--log-max-seconds", type=float, default=0,
+                        help="Rotate a text log after its active segment has been open this long (0 disables)")
+    parser.add_argument("--log-compression", choices=[c for c in COMPRESSION_SUFFIXES if c], default=None,
+                        help="Compress rotated log segments")
+    parser.add_argument("--network-model", default=None,
+                        help="JSON file of per-link latency, jitter, loss, bandwidth and reordering to emulate")
+    parser.add_argument("--dynamic-ports", action="store_true",
+                        help="Bind OS-assigned ports and share them through a registry instead of BASE_PORT + vm_id")
+    parser.add_argument("--num-machines", type=int, default=NUM_MACHINES, help="Number of VMs to run")
+    parser.add_argument("--num-event-choices", type=int, default=NUM_EVENT_CHOICES,
+                        help="Random events are drawn from 1..N, of which 1-3 are sends (4 reproduces less_internal)")
+    parser.add_argument("--tick-rate-range", type=float, nargs=2, default=TICK_RATE_RANGE, metavar=("LOW", "HIGH"),
+                        help="Range each VM's tick rate is drawn from")
+    parser.add_argument("--tick-rate-draw", choices=TICK_RATE_DRAWS, default="integer",
+                        help="Draw whole tick rates, or any rate in the range "
+                             "(uniform with 2 3 reproduces small_variation)")
+    parser.add_argument("--gossip", action="store_true",
+                        help="Send each event to a few peers from a bounded, shuffled random view instead of "
+                             "every partner")
+    parser.add_argument("--view-size", type=int, default=8, help="With --gossip, peers each VM keeps in its view")
+    parser.add_argument("--fanout", type=int, default=2, help="With --gossip, peers each send event goes to")
+    parser.add_argument("--shuffle-every", type=int, default=10,
+                        help="With --gossip, ticks between view shuffles with a random peer (0 disables)")
+    parser.add_argument("--adaptive", action="store_true",
+                        help="Drain extra messages per tick while a VM's queue is backlogged")
+    parser.add_argument("--queue-high", type=int, default=5,
+                        help="With --adaptive, queue length that counts as backlogged")
+    parser.add_argument("--wait-high-ms", type=float, default=500.0,
+                        help="With --adaptive, queue wait in milliseconds that counts as backlogged")
+    parser.add_argument("--max-extra-dequeues", type=int, default=4,
+                        help="With --adaptive, most extra messages processed in one tick")
+    parser.add_argument("--slowdown-factor", type=float, default=0,
+                        help="With --adaptive, ask peers to stretch their ticks by this factor when "
+                             "backlogged (values <= 1 disable)")
+    parser.add_argument("--slowdown-duration", type=float, default=2.0,
+                        help="Seconds a slowdown request lasts")
+    return parser.parse_args()
+
 if __name__ == "__main__":
-    run_duration = 60  # seconds to run the simulation
+    args = parse_args()
+    run_duration = args.duration  # seconds to run the simulation
+    num_machines = args.num_machines
+    network_model = None
+    if args.network_model:
+        with open(args.network_model) as file:
+            network_model = json.load(file)
+        try:
+            NetworkEmulator.from_config(network_model)  # Fail before any VM starts
+        except ValueError as e:
+            raise SystemExit(f"{args.network_model}: {e}")
+    try:
+        log_dir = create_log_dir(args.log_dir)
+    except FileExistsError as e:
+        raise SystemExit(str(e))
+    print(f"Writing logs to {log_dir}.")
+    with open(os.path.join(log_dir, TRIAL_CONFIG_FILENAME), "w") as file:
+        json.dump({"config": args.config_name, "num_machines": num_machines, "duration": run_duration,
+                   "tick_rate_range": list(args.tick_rate_range), "tick_rate_draw": args.tick_rate_draw,
+                   "num_event_choices": args.num_event_choices,
+                   "transport": args.transport, "multicast": args.multicast, "log_level": args.log_level,
+                   "network_model": args.network_model,
+                   "adaptive": args.adaptive, "slowdown_factor": args.slowdown_factor, "gossip": args.gossip,
+                   "view_size": args.view_size, "fanout": args.fanout}, file, indent=2)
+    vm_options = {"transport": args.transport, "multicast": args.multicast,
+                  "log_format": args.log_format, "columnar_format": args.columnar_format,
+                  "log_dir": log_dir, "log_max_bytes": args.log_max_bytes, "log_level": args.log_level,
+                  "internal_sample_every": args.internal_sample_every, "aggregate_window": args.aggregate_window,
+                  "profile": args.profile, "profile_ticks": args.profile_ticks,
+                  "log_max_seconds": args.log_max_seconds, "log_compression": args.log_compression,
+                  "num_machines": num_machines, "num_event_choices": args.num_event_choices,
+                  "tick_rate_range": args.tick_rate_range, "tick_rate_draw": args.tick_rate_draw}
+    # The clock sampler takes a seat at the start barrier so its window matches the VMs' ticks.
+    sampling = args.sample_rate > 0
+    vm_options["start_barrier"] = multiprocessing.Barrier(num_machines + 1 if sampling else num_machines)
+    if args.multicast:
+        vm_options["multicast_port"] = free_udp_port()
+    if network_model:
+        vm_options["network_model"] = network_model
+    if args.adaptive:
+        vm_options["adaptive"] = {"queue_high": args.queue_high, "wait_high_ms": args.wait_high_ms,
+                                  "max_extra_dequeues": args.max_extra_dequeues,
+                                  "slowdown_factor": args.slowdown_factor,
+                                  "slowdown_duration": args.slowdown_duration,
+                                  "slowdown_cooldown": args.slowdown_duration}
+    if args.gossip:
+        vm_options["gossip"] = {"view_size": args.view_size, "fanout": args.fanout,
+                                "shuffle_every": args.shuffle_every}
+    if args.dynamic_ports:
+        vm_options["port"] = 0
+        vm_options["registry"] = PortRegistry(num_machines)
     processes = []
-    for vm_id in range(NUM_MACHINES):
-        p = multiprocessing.Process(target=vm_process, args=(vm_id, run_duration))
+    if sampling:
+        vm_options["clock_board"] = ClockBoard(num_machines)
+        sampler = multiprocessing.Process(target=run_sampler,
+                                          args=(vm_options["clock_board"], os.path.join(log_dir, SNAPSHOT_FILENAME),
+                                                args.sample_rate, run_duration),
+                                          kwargs={"start_barrier": vm_options["start_barrier"],
+                                                  "start_timeout": STARTUP_TIMEOUT})
+        sampler.start()
+        processes.append(sampler)
+    for vm_id in range(num_machines):
+        p = multiprocessing.Process(target=vm_process, args=(vm_id, run_duration), kwargs=vm_options)
         p.start()
         processes.append(p)
     for p in processes:
         p.join()
+    if args.log_format != "text":
+        merge_trial_tables(log_dir, range(num_machines), args.columnar_format)
     print("Simulation completed.")
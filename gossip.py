@@ -0,0 +1,52 @@
+import random
+
+class PeerView:
+    """Bounded random view of the cluster that a gossiping VM sends to instead of every partner.
+
+    Each send event goes to fanout peers drawn from at most view_size known peers. Every
+    shuffle_every ticks the VM hands shuffle_length of its entries (plus its own address)
+    to a random peer, which merges them by overwriting random entries of its own view,
+    so views keep mixing without any VM ever holding the full membership.
+    """
+
+    def __init__(self, vm_id, peers, view_size=8, fanout=2, shuffle_every=10, shuffle_length=3, seed=None):
+        self.vm_id = vm_id
+        self.view_size = view_size
+        self.fanout = fanout
+        self.shuffle_every = shuffle_every
+        self.shuffle_length = shuffle_length
+        # A seed makes runs repeatable; mixing in vm_id keeps each VM's draws distinct.
+        self.rng = random.Random(f"{seed}-{vm_id}" if seed is not None else None)
+        self.peers = {}                     # peer_id -> (host, port)
+        self.pending = []                   # Entries received from shuffles, merged on the tick loop
+        self.merge(self.rng.sample(list(peers), min(view_size, len(peers))))
+
+    def merge(self, entries):
+        """Add (peer_id, host, port) entries, replacing random ones once the view is full."""
+        for peer_id, host, port in entries:
+            if peer_id == self.vm_id:
+                continue
+            if peer_id not in self.peers and len(self.peers) >= self.view_size:
+                del self.peers[self.rng.choice(list(self.peers))]
+            self.peers[peer_id] = (host, port)
+
+    def targets(self):
+        """Pick this event's fanout peers as (peer_id, host, port) tuples."""
+        chosen = self.rng.sample(list(self.peers), min(self.fanout, len(self.peers)))
+        return [(peer_id, *self.peers[peer_id]) for peer_id in chosen]
+
+    def shuffle(self, own_entry):
+        """Return (peer to shuffle with, entries to send it), or None with an empty view."""
+        if not self.peers:
+            return None
+        partner = self.rng.choice(list(self.peers))
+        sample = self.rng.sample(list(self.peers), min(self.shuffle_length, len(self.peers)))
+        return (partner, *self.peers[partner]), [own_entry] + [(p, *self.peers[p]) for p in sample if p != partner]
+
+    def receive_shuffle(self, entries):
+        """Queue entries from a peer's shuffle; called from listener threads."""
+        self.pending.append(entries)
+
+    def apply_pending(self):
+        while self.pending:
+            self.merge(self.pending.pop(0))
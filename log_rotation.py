@@ -0,0 +1,116 @@
+import gzip
+import io
+import os
+import re
+import shutil
+import threading
+import time
+
+try:
+    import zstandard
+except ImportError:  # Only needed for zstd-compressed segments
+    zstandard = None
+
+COMPRESSION_SUFFIXES = {None: "", "gzip": ".gz", "zstd": ".zst"}
+
+def require_zstandard():
+    if zstandard is None:
+        raise ImportError("zstd log compression needs zstandard: pip install zstandard")
+
+class RotatingLogWriter:
+    """Append-only text log that rolls over by size or age and compresses old segments.
+
+    The active segment is always the plain file at path. Rolled-over segments are renamed
+    to path.1, path.2, ... in the order they were written and then compressed on a
+    background thread so the tick loop never waits on the compressor.
+    """
+
+    def __init__(self, path, max_bytes=0, max_seconds=0, compression=None):
+        if compression == "zstd":
+            require_zstandard()
+        self.path = path
+        self.max_bytes = max_bytes          # 0 disables size-based rotation
+        self.max_seconds = max_seconds      # 0 disables time-based rotation
+        self.compression = compression      # None, "gzip" or "zstd"
+        self.segment_index = len(log_segments(path)) - os.path.exists(path)  # Resume numbering after old segments
+        self.compressors = []
+        self.file = None
+
+    def open(self):
+        self.file = open(self.path, "a", buffering=1)   # Line buffered: every event reaches the OS
+        self.bytes_written = self.file.tell()
+        self.opened_at = time.time()
+
+    def write(self, line):
+        if self.file is None:
+            self.open()
+        elif ((self.max_bytes and self.bytes_written + len(line) > self.max_bytes) or
+              (self.max_seconds and time.time() - self.opened_at >= self.max_seconds)):
+            self.rotate()
+            self.open()
+        self.file.write(line)
+        self.bytes_written += len(line)
+
+    def rotate(self):
+        """Close the active segment and hand it to a background compressor."""
+        self.file.close()
+        self.file = None
+        self.segment_index += 1
+        segment_path = f"{self.path}.{self.segment_index}"
+        os.replace(self.path, segment_path)
+        if self.compression:
+            compressor = threading.Thread(target=compress_segment, args=(segment_path, self.compression))
+            compressor.start()
+            self.compressors.append(compressor)
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        for compressor in self.compressors:
+            compressor.join()
+        self.compressors = []
+
+def compress_segment(segment_path, compression):
+    """Compress a rolled-over segment next to itself and remove the plain copy."""
+    compressed_path = segment_path + COMPRESSION_SUFFIXES[compression]
+    with open(segment_path, "rb") as source:
+        if compression == "zstd":
+            with open(compressed_path, "wb") as target:
+                zstandard.ZstdCompressor().copy_stream(source, target)
+        else:
+            with gzip.open(compressed_path, "wb") as target:
+                shutil.copyfileobj(source, target)
+    os.remove(segment_path)
+
+def log_segments(path):
+    """Return every segment of a log in write order: path.1[.gz|.zst], path.2, ..., then path."""
+    directory = os.path.dirname(path) or "."
+    base = os.path.basename(path)
+    pattern = re.compile(re.escape(base) + r"\.(\d+)(\.gz|\.zst)?$")
+    segments = {}
+    if os.path.isdir(directory):
+        for name in os.listdir(directory):
+            match = pattern.match(name)
+            # A plain segment left next to its compressed copy means compression never finished.
+            if match and (match.group(2) is None or int(match.group(1)) not in segments):
+                segments[int(match.group(1))] = os.path.join(directory, name)
+    segments = [segments[index] for index in sorted(segments)]
+    if os.path.exists(path):
+        segments.append(path)
+    return segments
+
+def open_segment(segment_path):
+    if segment_path.endswith(".gz"):
+        return gzip.open(segment_path, "rt")
+    if segment_path.endswith(".zst"):
+        require_zstandard()
+        reader = zstandard.ZstdDecompressor().stream_reader(open(segment_path, "rb"), closefd=True)
+        return io.TextIOWrapper(reader)
+    return open(segment_path, "r")
+
+def read_log_lines(path):
+    """Yield the lines of a log across all of its (possibly compressed) segments."""
+    for segment_path in log_segments(path):
+        with open_segment(segment_path) as file:
+            yield from file
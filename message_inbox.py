@@ -0,0 +1,67 @@
+import collections
+import queue
+import threading
+import time
+
+class MessageInbox:
+    """Unbounded FIFO inbox drained by a single consumer, the VM's tick loop.
+
+    Producers append to a deque and the consumer pops from it without taking a lock
+    (both are atomic under the GIL). One Condition is the only wakeup primitive, and
+    producers touch it only while a consumer is blocked in get(). Supports the subset
+    of the queue.Queue interface the simulation used, plus pop() and drain().
+    """
+
+    def __init__(self):
+        self.messages = collections.deque()
+        self.wakeup = threading.Condition(threading.Lock())
+        self.waiting = 0                    # Consumers blocked in get()
+
+    def put(self, message):
+        self.messages.append(message)
+        if self.waiting:
+            with self.wakeup:
+                self.wakeup.notify()
+
+    def pop(self):
+        """Return (oldest message, messages still queued), or (None, 0) when empty."""
+        try:
+            message = self.messages.popleft()
+        except IndexError:
+            return None, 0
+        return message, len(self.messages)
+
+    def drain(self, limit=None):
+        """Remove and return up to limit messages (all of them by default), oldest first."""
+        messages = self.messages
+        count = len(messages) if limit is None else min(limit, len(messages))
+        return [messages.popleft() for _ in range(count)]
+
+    def get(self, block=True, timeout=None):
+        try:
+            return self.messages.popleft()
+        except IndexError:
+            if not block:
+                raise queue.Empty
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.wakeup:
+            # Registering before re-checking means a put() either lands before the check or notifies us.
+            self.waiting += 1
+            try:
+                while not self.messages:
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        raise queue.Empty
+                    self.wakeup.wait(remaining)
+            finally:
+                self.waiting -= 1
+        return self.messages.popleft()
+
+    def get_nowait(self):
+        return self.get(block=False)
+
+    def empty(self):
+        return not self.messages
+
+    def qsize(self):
+        return len(self.messages)
@@ -0,0 +1,156 @@
+import json
+import math
+import random
+import threading
+import time
+
+# Example network model: every link gets "default", with any settings in "links" overriding it by "src->dst".
+# {
+#   "default": {"latency": 0.05, "jitter": 0.01, "distribution": "normal", "loss": 0.01},
+#   "links": {"0->1": {"latency": 0.2, "bandwidth": 2000, "reorder": 0.05}}
+# }
+LATENCY_DISTRIBUTIONS = ("constant", "uniform", "normal", "exponential")
+
+class LinkModel:
+    """Delay, loss and bandwidth behaviour of one directed link between two VMs."""
+
+    def __init__(self, latency=0.0, jitter=0.0, distribution="normal", loss=0.0, bandwidth=0,
+                 reorder=0.0, reorder_delay=None):
+        if distribution not in LATENCY_DISTRIBUTIONS:
+            raise ValueError(f"Unknown latency distribution: {distribution}")
+        self.latency = latency              # Base one-way delay in seconds
+        self.jitter = jitter                # Spread around latency (stddev, half-width or mean extra)
+        self.distribution = distribution
+        self.loss = loss                    # Probability a message is dropped
+        self.bandwidth = bandwidth          # Bytes per second, 0 for unlimited
+        self.reorder = reorder              # Probability a message is held back so later ones overtake it
+        self.reorder_delay = reorder_delay if reorder_delay is not None else max(2 * latency, 0.01)
+        self.busy_until = 0.0               # When the link finishes serializing queued messages
+
+    def sample_delay(self, rng):
+        """Draw one propagation delay from the link's latency distribution."""
+        if self.distribution == "uniform":
+            delay = self.latency + rng.uniform(-self.jitter, self.jitter)
+        elif self.distribution == "normal":
+            delay = rng.gauss(self.latency, self.jitter) if self.jitter else self.latency
+        elif self.distribution == "exponential":
+            delay = self.latency + (rng.expovariate(1 / self.jitter) if self.jitter else 0.0)
+        else:
+            delay = self.latency
+        if self.reorder and rng.random() < self.reorder:
+            delay += self.reorder_delay
+        return max(0.0, delay)
+
+class TimerWheel:
+    """Hashed timer wheel: O(1) scheduling of many in-flight deliveries on one thread."""
+
+    def __init__(self, resolution=0.001, num_slots=1024):
+        self.resolution = resolution
+        self.slots = [[] for _ in range(num_slots)]
+        self.current_tick = 0
+        self.pending = 0
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.start_time = time.monotonic()
+
+    def schedule(self, delay, callback, *args):
+        """Run callback(*args) on the wheel thread after roughly delay seconds."""
+        with self.lock:
+            target = self.current_tick + max(1, math.ceil(delay / self.resolution))
+            self.slots[target % len(self.slots)].append((target, callback, args))
+            self.pending += 1
+
+    def advance(self, now_tick):
+        """Fire every timer due up to now_tick."""
+        while self.current_tick < now_tick:
+            with self.lock:
+                self.current_tick += 1
+                slot = self.slots[self.current_tick % len(self.slots)]
+                due = [entry for entry in slot if entry[0] <= self.current_tick]
+                if due:
+                    # Entries more than one revolution out stay in the slot.
+                    slot[:] = [entry for entry in slot if entry[0] > self.current_tick]
+                    self.pending -= len(due)
+            for _, callback, args in due:
+                callback(*args)
+
+    def run(self):
+        while not self.stop_event.is_set():
+            self.advance(int((time.monotonic() - self.start_time) / self.resolution))
+            time.sleep(self.resolution)
+
+    def start(self):
+        self.start_time = time.monotonic() - self.current_tick * self.resolution
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """Stop the wheel and return how many timers never fired."""
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+        return self.pending
+
+class NetworkEmulator:
+    """Sender-side network model: delays, drops and reorders messages before they hit the socket."""
+
+    def __init__(self, default=None, links=None, resolution=0.001, seed=None):
+        self.default = default or {}
+        self.link_config = links or {}
+        self.links = {}
+        # Build every configured link once so a bad model fails here, not inside a VM's tick loop.
+        for key in ["default", *self.link_config]:
+            self.link_model(key)
+        self.rng = random.Random(seed)
+        self.wheel = TimerWheel(resolution)
+        self.stats = {"submitted": 0, "dropped": 0, "undelivered": 0}
+
+    @classmethod
+    def from_config(cls, config, stream=0):
+        """Build an emulator from a network model dict (see the example above).
+
+        A "seed" in the config makes runs repeatable; stream keeps each sender's draws distinct.
+        """
+        seed = f"{config['seed']}-{stream}" if "seed" in config else None
+        return cls(config.get("default"), config.get("links"), config.get("resolution", 0.001), seed)
+
+    @classmethod
+    def from_file(cls, path, stream=0):
+        with open(path) as file:
+            return cls.from_config(json.load(file), stream)
+
+    def link_model(self, key):
+        """Build the LinkModel for a "src->dst" key; a link entry overrides only the settings it names."""
+        try:
+            return LinkModel(**{**self.default, **self.link_config.get(key, {})})
+        except (TypeError, ValueError) as e:
+            raise ValueError(f"Bad network model settings for link {key}: {e}") from None
+
+    def link(self, src, dst):
+        key = (src, dst)
+        if key not in self.links:
+            self.links[key] = self.link_model(f"{src}->{dst}")
+        return self.links[key]
+
+    def submit(self, src, dst, size, deliver, *args):
+        """Schedule deliver(*args) after the link's delay, or drop it according to the link's loss."""
+        link = self.link(src, dst)
+        self.stats["submitted"] += 1
+        if link.loss and self.rng.random() < link.loss:
+            self.stats["dropped"] += 1
+            return
+        delay = link.sample_delay(self.rng)
+        if link.bandwidth:
+            # Messages on a link serialize one after another at the capped rate.
+            now = time.monotonic()
+            link.busy_until = max(now, link.busy_until) + size / link.bandwidth
+            delay += link.busy_until - now
+        self.wheel.schedule(delay, deliver, *args)
+
+    def start(self):
+        self.wheel.start()
+
+    def stop(self):
+        self.stats["undelivered"] = self.wheel.stop()
+        return self.stats
@@ -1,7 +1,30 @@
 import unittest
 import queue
 import json
-from distributed_simulation import VirtualMachine  # Import from your simulation file
+import random
+import time
+import threading
+import socket
+import os
+import tempfile
+from unittest import mock
+from distributed_simulation import VirtualMachine, BASE_PORT, PortRegistry, create_log_dir, free_udp_port  # Import from your simulation file
+from clock_board import ClockBoard, run_sampler, read_snapshots
+import columnar_log
+from columnar_log import EVENT_CODES, event_code, merge_trial_tables, read_table
+from cluster_launcher import report_ready, run_coordinator, vm_addresses
+from network_emulation import LinkModel, NetworkEmulator, TimerWheel
+from tick_profiler import LOG, PHASES, PROCESS, TickProfiler
+from adaptive_control import AdaptiveController
+from message_inbox import MessageInbox
+from gossip import PeerView
+from log_rotation import RotatingLogWriter, log_segments, read_log_lines
+try:
+    import numpy as np
+    import analysis_visualization
+    import trial_aggregate
+except ImportError:  # pandas/matplotlib are only needed for the analysis tests
+    analysis_visualization = trial_aggregate = None
 
 class TestVirtualMachine(unittest.TestCase):
     """Unit tests for the Virtual Machine in the distributed logical clock simulation."""
@@ -72,5 +95,819 @@ class TestVirtualMachine(unittest.TestCase):
         self.assertEqual(drift_vm0_vm1, 20, "Drift between VM0 and VM1 should be 20.")
         self.assertEqual(drift_vm0_vm2, 10, "Drift between VM0 and VM2 should be 10.")
 
+    def test_udp_transport_delivers_and_counts_loss(self):
+        """Test that UDP datagrams are queued and sequence gaps are counted as losses."""
+        receiver = VirtualMachine(vm_id=41, tick_rate=3, partner_info=[], run_duration=10, transport="udp")
+        sender = VirtualMachine(vm_id=40, tick_rate=3, partner_info=[], run_duration=10, transport="udp")
+        receiver.open_udp_socket()
+        listener = threading.Thread(target=receiver.start_listener, daemon=True)
+        listener.start()
+        try:
+            sender.send_message('localhost', BASE_PORT + 41, {"sender": 40, "clock": 3})
+            sender.send_seq[('localhost', BASE_PORT + 41)] += 2  # Pretend two datagrams were dropped
+            sender.broadcast_message([(41, 'localhost', BASE_PORT + 41)], {"sender": 40, "clock": 4})
+            first = receiver.message_queue.get(timeout=2)
+            second = receiver.message_queue.get(timeout=2)
+        finally:
+            receiver.stop_event.set()
+            listener.join()
+            sender.udp_socket.close()
+        self.assertEqual((first["clock"], second["clock"]), (3, 4))
+        self.assertEqual(receiver.transport_stats["received"], 2)
+        self.assertEqual(receiver.transport_stats["lost"], 2)
+
+    def test_event_mix_follows_num_event_choices(self):
+        """Test that with 4 event choices (the less_internal mix) most random events are sends."""
+        with tempfile.TemporaryDirectory() as tmp:
+            vm = VirtualMachine(vm_id=0, tick_rate=1000, partner_info=[(1, 'localhost', 1), (2, 'localhost', 2)],
+                                run_duration=0.3, log_dir=tmp, num_event_choices=4, transport="udp", port=0, seed=3)
+            vm.send_message = lambda *args: None  # Count send events without any network traffic
+            vm.run()
+            with open(vm.log_filename) as file:
+                events = [line.split(" |")[0] for line in file if not line.startswith("TRANSPORT")]
+        sends = sum(event.startswith("SEND") for event in events)
+        self.assertGreater(sends / len(events), 0.6)  # 3 in 4, against 3 in 10 by default
+
+    def test_multicast_stays_within_its_run(self):
+        """Test that a broadcast reaches its own run's multicast port but not a concurrent run's."""
+        own_port, other_port = free_udp_port(), free_udp_port()
+        sender = VirtualMachine(vm_id=0, tick_rate=1, partner_info=[], run_duration=0, transport="udp",
+                                multicast=True, multicast_port=own_port, port=0)
+        # Both receivers share vm_id 1, as the VMs of two concurrent runs would.
+        receivers = [VirtualMachine(vm_id=1, tick_rate=1, partner_info=[], run_duration=0, transport="udp",
+                                    multicast=True, multicast_port=port, port=0) for port in (own_port, other_port)]
+        listeners = []
+        for receiver in receivers:
+            receiver.open_udp_socket()
+            listeners.append(threading.Thread(target=receiver.start_listener, daemon=True))
+            listeners[-1].start()
+        try:
+            sender.broadcast_message([(1, 'localhost', receivers[0].port)], {"sender": 0, "clock": 5})
+            self.assertEqual(receivers[0].message_queue.get(timeout=2)["clock"], 5)
+            time.sleep(0.1)
+            self.assertTrue(receivers[1].message_queue.empty())
+        finally:
+            for receiver in receivers:
+                receiver.stop_event.set()
+            for listener in listeners:
+                listener.join()
+            sender.udp_socket.close()
+
+    def test_receive_logs_latency_and_queue_wait(self):
+        """Test that a stamped message logs its network latency and queue wait separately."""
+        with tempfile.TemporaryDirectory() as tmp:
+            vm = VirtualMachine(vm_id=0, tick_rate=3, partner_info=[], run_duration=10, log_dir=tmp)
+            message = vm.stamp_message({"sender": 1, "clock": 4}, "link")
+            message["sent_at"] -= 0.05  # Pretend the network took 50 ms
+            vm.enqueue(message)
+            time.sleep(0.02)
+            vm.process_message(vm.message_queue.get_nowait(), system_time=100)
+            vm.close_logs()
+            with open(vm.log_filename) as file:
+                line = file.read()
+        latency = float(line.split("Latency: ")[1].split(" ms")[0])
+        queue_wait = float(line.split("Queue Wait: ")[1].split(" ms")[0])
+        self.assertGreaterEqual(latency, 50)
+        self.assertLess(latency, 1000)
+        self.assertGreaterEqual(queue_wait, 20)
+
+    def test_arrival_counters_survive_concurrent_connections(self):
+        """Test that arrivals recorded from many handler threads at once are all counted."""
+        def arrive(sender):
+            for seq in range(2000):
+                self.vm.record_arrival({"sender": sender, "clock": 1, "seq": seq})
+        threads = [threading.Thread(target=arrive, args=(sender,)) for sender in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.vm.transport_stats["received"], 16000)
+        self.assertEqual(self.vm.transport_stats["lost"], 0)
+
+    def test_late_datagram_counts_as_reordered(self):
+        """Test that an out-of-order sequence number is counted as a reorder, not a loss."""
+        for seq in (0, 2, 1):
+            self.vm.record_arrival({"sender": 1, "clock": 1, "seq": seq})
+        self.assertEqual(self.vm.transport_stats["reordered"], 1)
+        self.assertEqual(self.vm.transport_stats["lost"], 0)
+
+class TestStartup(unittest.TestCase):
+    """Tests for dynamic port binding and the startup barrier."""
+
+    def test_dynamic_ports_and_barrier_lose_no_messages(self):
+        """Test that VMs on OS-assigned ports find each other and receive every message sent."""
+        with tempfile.TemporaryDirectory() as tmp:
+            registry = PortRegistry(3)
+            barrier = threading.Barrier(3)
+            vms = [VirtualMachine(vm_id=i, tick_rate=50, run_duration=0.5, log_dir=tmp, port=0,
+                                  registry=registry, start_barrier=barrier,
+                                  partner_info=[(p, 'localhost', None) for p in range(3) if p != i])
+                   for i in range(3)]
+            threads = [threading.Thread(target=vm.run) for vm in vms]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(len({vm.port for vm in vms}), 3)
+        self.assertNotIn(BASE_PORT, {vm.port for vm in vms})
+        sent = sum(vm.transport_stats["sent"] for vm in vms)
+        received = sum(vm.transport_stats["received"] for vm in vms)
+        self.assertGreater(sent, 0)
+        # Only a VM's final tick can race a peer that has already shut down.
+        self.assertGreaterEqual(received, sent - len(vms))
+
+class TestClusterLauncher(unittest.TestCase):
+    """Tests for the multi-host cluster launcher in its local stand-in mode."""
+
+    def test_vm_addresses_follow_worker_ports(self):
+        """Test that each worker's VMs listen on consecutive ports on that worker's host."""
+        spec = {"workers": [{"host": "a", "port": 7100, "vm_ids": [0, 2]},
+                            {"host": "b", "port": 7100, "vm_ids": [1]}]}
+        self.assertEqual(vm_addresses(spec), {0: ("a", 7100), 2: ("a", 7101), 1: ("b", 7100)})
+
+    def test_ready_wait_uses_the_cluster_startup_timeout(self):
+        """Test that a worker waits for go as long as the spec's startup timeout allows, and no longer."""
+        server = socket.create_server(('localhost', 0))
+        collector = {"host": "localhost", "port": server.getsockname()[1]}
+
+        def coordinator(delay):
+            conn, _ = server.accept()
+            with conn:
+                conn.makefile("rb").readline()
+                time.sleep(delay)
+                conn.sendall(b"go\n")
+
+        try:
+            slow = threading.Thread(target=coordinator, args=(0.3,))
+            slow.start()
+            report_ready(collector, 0, startup_timeout=2)
+            slow.join()
+            late = threading.Thread(target=coordinator, args=(0.5,))
+            late.start()
+            with self.assertRaises(socket.timeout):
+                report_ready(collector, 0, startup_timeout=0.1)
+            late.join()
+        finally:
+            server.close()
+
+    def test_local_cluster_gathers_all_logs(self):
+        """Test that two local worker process groups run their VMs and ship every log back."""
+        with tempfile.TemporaryDirectory() as tmp:
+            spec = {"config": "local-pair", "run_duration": 1,
+                    "collector": {"host": "localhost", "port": BASE_PORT + 500},
+                    "workers": [{"host": "localhost", "port": BASE_PORT + 510, "vm_ids": [0, 1]},
+                                {"host": "localhost", "port": BASE_PORT + 520, "vm_ids": [2, 3]}]}
+            spec_path = os.path.join(tmp, "spec.json")
+            with open(spec_path, "w") as file:
+                json.dump(spec, file)
+            trial_dir = os.path.join(tmp, "trial")
+            run_coordinator(spec_path, trial_dir, local=True)
+            gathered = sorted(os.listdir(trial_dir))
+            with open(os.path.join(trial_dir, "trial_config.json")) as file:
+                config = json.load(file)
+        self.assertEqual(gathered, ["cluster_spec.json"] + [f"machine_{i}.log" for i in range(4)]
+                         + ["trial_config.json"])
+        self.assertEqual((config["config"], config["num_machines"], config["num_workers"]), ("local-pair", 4, 2))
+
+class TestNetworkEmulation(unittest.TestCase):
+    """Unit tests for the emulated network between VMs."""
+
+    def test_link_delays_stay_within_uniform_jitter(self):
+        """Test that uniform jitter keeps every delay within latency +/- jitter."""
+        link = LinkModel(latency=0.05, jitter=0.01, distribution="uniform")
+        rng = random.Random(7)
+        delays = [link.sample_delay(rng) for _ in range(1000)]
+        self.assertTrue(all(0.04 <= d <= 0.06 for d in delays))
+
+    def test_link_entry_overrides_only_the_settings_it_names(self):
+        """Test that a per-link entry inherits every default setting it does not override."""
+        emulator = NetworkEmulator.from_config({
+            "default": {"latency": 0.05, "jitter": 0.01, "distribution": "uniform", "loss": 0.01},
+            "links": {"0->1": {"latency": 0.2, "bandwidth": 2000}}})
+        link = emulator.link(0, 1)
+        self.assertEqual((link.latency, link.bandwidth), (0.2, 2000))
+        self.assertEqual((link.jitter, link.distribution, link.loss), (0.01, "uniform", 0.01))
+        self.assertEqual(emulator.link(1, 0).latency, 0.05)
+
+    def test_bad_link_settings_fail_when_the_model_is_loaded(self):
+        """Test that a misspelled link setting is rejected up front, not on the link's first message."""
+        with self.assertRaisesRegex(ValueError, "0->1"):
+            NetworkEmulator.from_config({"default": {"latency": 0.05}, "links": {"0->1": {"latncy": 0.2}}})
+        with self.assertRaisesRegex(ValueError, "default"):
+            NetworkEmulator.from_config({"default": {"distribution": "pareto"}})
+
+    def test_timer_wheel_fires_in_deadline_order(self):
+        """Test that timers, including ones past a full revolution, fire in deadline order."""
+        wheel = TimerWheel(resolution=0.001, num_slots=8)
+        fired = []
+        for delay in (0.02, 0.005, 0.012):
+            wheel.schedule(delay, fired.append, delay)
+        wheel.advance(10)
+        self.assertEqual(fired, [0.005])
+        wheel.advance(25)
+        self.assertEqual(fired, [0.005, 0.012, 0.02])
+        self.assertEqual(wheel.pending, 0)
+
+    def test_emulated_link_delays_and_drops_messages(self):
+        """Test that a VM's messages arrive only after the link latency, and lossy links drop them."""
+        receiver = VirtualMachine(vm_id=43, tick_rate=3, partner_info=[], run_duration=10, transport="udp")
+        sender = VirtualMachine(vm_id=42, tick_rate=3, partner_info=[], run_duration=10, transport="udp",
+                                network_model={"seed": 1, "default": {"latency": 0.2},
+                                               "links": {"42->44": {"loss": 1.0}}})
+        receiver.open_udp_socket()
+        listener = threading.Thread(target=receiver.start_listener, daemon=True)
+        listener.start()
+        sender.network.start()
+        try:
+            sent_at = time.monotonic()
+            sender.send_message('localhost', BASE_PORT + 43, {"sender": 42, "clock": 1}, partner_id=43)
+            sender.send_message('localhost', BASE_PORT + 43, {"sender": 42, "clock": 2}, partner_id=44)
+            message = receiver.message_queue.get(timeout=2)
+            elapsed = time.monotonic() - sent_at
+        finally:
+            stats = sender.network.stop()
+            receiver.stop_event.set()
+            listener.join()
+            sender.udp_socket.close()
+        self.assertEqual(message["clock"], 1)
+        self.assertGreaterEqual(elapsed, 0.19)
+        self.assertEqual(stats["dropped"], 1)
+
+    def test_bandwidth_cap_serializes_messages(self):
+        """Test that a bandwidth cap queues messages back to back on the link."""
+        emulator = NetworkEmulator(default={"bandwidth": 1000})
+        for _ in range(3):
+            emulator.submit(0, 1, 100, lambda: None)
+        link = emulator.link(0, 1)
+        self.assertGreaterEqual(link.busy_until - time.monotonic(), 0.25)
+
+class TestClockBoard(unittest.TestCase):
+    """Unit tests for the shared-memory clock snapshot board."""
+
+    def test_publish_and_read_slots(self):
+        """Test that each VM's slot holds its own latest clock and tick count."""
+        board = ClockBoard(3)
+        board.publish(0, 5, 2)
+        board.publish(2, 9, 4)
+        board.publish(0, 7, 3)
+        self.assertEqual(board.snapshot(), [(7, 3), (0, 0), (9, 4)])
+
+    def test_sampler_writes_columnar_snapshots(self):
+        """Test that the sampler records simultaneous clocks that can be read back by column."""
+        board = ClockBoard(2)
+        board.publish(0, 12, 6)
+        board.publish(1, 4, 2)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "snapshots.clk")
+            run_sampler(board, path, sample_rate=200, run_duration=0.1, block_rows=5)
+            columns = read_snapshots(path)
+        self.assertGreater(len(columns["time"]), 5)
+        self.assertEqual(len(columns["clock_0"]), len(columns["time"]))
+        self.assertEqual(set(columns["clock_0"]), {12})
+        self.assertEqual(set(columns["ticks_1"]), {2})
+
+    def test_sampler_waits_for_the_start_barrier(self):
+        """Test that a sampler holding a barrier seat records nothing from before the VMs start."""
+        board = ClockBoard(1)
+        barrier = threading.Barrier(2)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "snapshots.clk")
+            sampler = threading.Thread(target=run_sampler, args=(board, path, 200, 0.1),
+                                       kwargs={"start_barrier": barrier})
+            sampler.start()
+            time.sleep(0.1)
+            board.publish(0, 3, 1)  # The VM's state by the time it reaches the barrier
+            barrier.wait()
+            sampler.join()
+            columns = read_snapshots(path)
+        self.assertGreater(len(columns["time"]), 5)
+        self.assertEqual(set(columns["clock_0"]), {3})
+
+class TestLogRotation(unittest.TestCase):
+    """Unit tests for size-bounded, compressed log streams."""
+
+    def test_rotated_gzip_segments_read_back_as_one_stream(self):
+        """Test that size-based rotation compresses old segments and readers see every line in order."""
+        with tempfile.TemporaryDirectory() as tmp:
+            vm = VirtualMachine(vm_id=0, tick_rate=3, partner_info=[], run_duration=10,
+                                log_dir=tmp, log_max_bytes=200, log_compression="gzip")
+            for _ in range(20):
+                vm.logical_clock += 1
+                vm.log_event("INTERNAL", system_time=100 + vm.logical_clock)
+            vm.close_logs()
+            segments = log_segments(vm.log_filename)
+            lines = list(read_log_lines(vm.log_filename))
+        self.assertGreater(len(segments), 2)
+        self.assertTrue(all(path.endswith(".gz") for path in segments[:-1]))
+        self.assertEqual([int(line.split("Logical Clock: ")[1].split(" ")[0]) for line in lines], list(range(1, 21)))
+
+    def test_writer_resumes_segment_numbering(self):
+        """Test that reopening a rotated log continues after the existing segments."""
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "machine_0.log")
+            writer = RotatingLogWriter(path, max_bytes=10)
+            for line in ("first line\n", "second line\n"):
+                writer.write(line)
+            writer.close()
+            writer = RotatingLogWriter(path, max_bytes=10)
+            writer.write("third line\n")
+            writer.close()
+            self.assertEqual(list(read_log_lines(path)), ["first line\n", "second line\n", "third line\n"])
+
+    def test_run_directories_never_mix_trials(self):
+        """Test that runs get separate log directories and an occupied --log-dir is refused."""
+        with tempfile.TemporaryDirectory() as tmp:
+            runs_dir = os.path.join(tmp, "runs")
+            first, second = create_log_dir(runs_dir=runs_dir), create_log_dir(runs_dir=runs_dir)
+            self.assertNotEqual(first, second)
+            self.assertTrue(os.path.isdir(first) and os.path.isdir(second))
+            chosen = os.path.join(tmp, "chosen")
+            self.assertEqual(create_log_dir(chosen), chosen)
+            with open(os.path.join(chosen, "machine_0.log"), "w") as file:
+                file.write("INTERNAL | System Time: 100.0000 | Logical Clock: 1 | \n")
+            with self.assertRaises(FileExistsError):
+                create_log_dir(chosen)  # Reusing it would append onto the earlier trial
+
+class TestLogLevels(unittest.TestCase):
+    """Tests for sampled and aggregated text logging."""
+
+    def run_scripted_events(self, log_dir, **vm_options):
+        """Drive a VM through a fixed mix of events and return its log path."""
+        vm = VirtualMachine(vm_id=0, tick_rate=3, partner_info=[], run_duration=10, log_dir=log_dir, **vm_options)
+        rng = random.Random(3)
+        for step in range(300):
+            system_time = 100 + step * 0.1
+            choice = rng.randint(1, 10)
+            if choice == 1:
+                vm.process_message({"sender": 1, "clock": vm.logical_clock + rng.randint(0, 6)}, system_time)
+            elif choice == 2:
+                vm.logical_clock += 1
+                vm.log_event("SEND to VM 1", system_time, "Message Clock Sent: 0", peer=1)
+            else:
+                vm.logical_clock += 1
+                vm.log_event("INTERNAL", system_time)
+        vm.close_logs()
+        return vm.log_filename
+
+    def test_sampled_log_skips_internal_events(self):
+        """Test that sampled logging writes only every k-th INTERNAL line but records the skipped ones."""
+        with tempfile.TemporaryDirectory() as full_dir, tempfile.TemporaryDirectory() as sampled_dir:
+            full = list(read_log_lines(self.run_scripted_events(full_dir)))
+            sampled = list(read_log_lines(self.run_scripted_events(sampled_dir, log_level="sampled",
+                                                                   internal_sample_every=5)))
+        self.assertLess(len(sampled), len(full) / 2)
+        skipped = sum(int(line.split("Skipped Internal: ")[1]) for line in sampled if "Skipped Internal" in line)
+        self.assertEqual(len(sampled) + skipped, len(full))
+
+    @unittest.skipIf(analysis_visualization is None, "pandas is not installed")
+    def test_reduced_logs_keep_jump_statistics(self):
+        """Test that jump and gap statistics from sampled and aggregate logs match the full log."""
+        results = {}
+        with tempfile.TemporaryDirectory() as tmp:
+            for level in ("full", "sampled", "aggregate"):
+                level_dir = os.path.join(tmp, level)
+                os.makedirs(level_dir)
+                df = analysis_visualization.parse_log(self.run_scripted_events(level_dir, log_level=level))
+                results[level] = (analysis_visualization.analyze_clock_jumps(df, 0),
+                                  analysis_visualization.analyze_clock_gaps(df, 0), len(df))
+        for level in ("sampled", "aggregate"):
+            self.assertLess(results[level][2], results["full"][2])
+            for full_stats, reduced_stats in zip(results["full"][:2], results[level][:2]):
+                for key, value in full_stats.items():
+                    self.assertAlmostEqual(float(reduced_stats[key]), float(value), msg=f"{level} {key}")
+
+class TestTickProfiler(unittest.TestCase):
+    """Tests for the per-phase tick profiler."""
+
+    def test_log_time_is_taken_out_of_the_interrupted_phase(self):
+        """Test that time charged to LOG is not also counted in the phase it interrupted."""
+        profiler = TickProfiler(capacity=4)
+        profiler.start_tick()
+        time.sleep(0.01)
+        log_start = time.perf_counter_ns()
+        time.sleep(0.03)
+        profiler.add(LOG, time.perf_counter_ns() - log_start)
+        profiler.mark(PROCESS)
+        profiler.end_tick()
+        self.assertGreaterEqual(profiler.phase_samples(LOG)[0], 30_000_000)
+        self.assertLess(profiler.phase_samples(PROCESS)[0], 25_000_000)
+
+    def test_ring_keeps_only_the_latest_ticks(self):
+        """Test that the ring buffer wraps and keeps the most recent capacity ticks."""
+        profiler = TickProfiler(capacity=3)
+        for tick in range(5):
+            profiler.current[PROCESS] = tick
+            profiler.end_tick()
+        self.assertEqual(profiler.ticks, 5)
+        self.assertEqual(sorted(profiler.phase_samples(PROCESS)), [2, 3, 4])
+
+    def test_profiled_run_writes_summary_and_folded_profile(self):
+        """Test that a profiled VM run dumps a per-phase summary and folded stacks."""
+        with tempfile.TemporaryDirectory() as tmp:
+            vm = VirtualMachine(vm_id=44, tick_rate=100, partner_info=[], run_duration=0.2, log_dir=tmp,
+                                profile=True)
+            vm.run()
+            with open(os.path.join(tmp, "machine_44.profile.txt")) as file:
+                summary = file.read()
+            with open(os.path.join(tmp, "machine_44.folded")) as file:
+                folded = dict(line.rsplit(" ", 1) for line in file.read().splitlines())
+        self.assertGreater(vm.profiler.ticks, 5)
+        for phase in PHASES:
+            if phase != "send":  # No partners, so nothing is ever sent
+                self.assertIn(phase, summary)
+        self.assertGreater(int(folded["vm_44;run;sleep"]), 100000)
+
+class TestMessageInbox(unittest.TestCase):
+    """Tests for the deque-backed VM inbox."""
+
+    def test_pop_returns_message_and_remaining_depth(self):
+        """Test that pop hands back the oldest message with the depth left behind it."""
+        inbox = MessageInbox()
+        for clock in range(3):
+            inbox.put({"clock": clock})
+        self.assertEqual(inbox.pop(), ({"clock": 0}, 2))
+        self.assertEqual(inbox.drain(), [{"clock": 1}, {"clock": 2}])
+        self.assertEqual(inbox.pop(), (None, 0))
+        with self.assertRaises(queue.Empty):
+            inbox.get_nowait()
+
+    def test_drain_respects_limit(self):
+        """Test that drain removes at most limit messages, oldest first."""
+        inbox = MessageInbox()
+        for clock in range(5):
+            inbox.put(clock)
+        self.assertEqual(inbox.drain(2), [0, 1])
+        self.assertEqual(inbox.qsize(), 3)
+
+    def test_blocked_get_wakes_on_put(self):
+        """Test that a consumer blocked in get is woken by a put from another thread."""
+        inbox = MessageInbox()
+        threading.Timer(0.05, inbox.put, args=({"clock": 1},)).start()
+        self.assertEqual(inbox.get(timeout=2), {"clock": 1})
+        with self.assertRaises(queue.Empty):
+            inbox.get(timeout=0.05)
+
+class TestGossip(unittest.TestCase):
+    """Tests for gossip peer views and clock provenance."""
+
+    def test_view_stays_bounded_and_targets_fanout_peers(self):
+        """Test that the view never exceeds view_size and each event picks fanout distinct peers."""
+        peers = [(pid, 'localhost', BASE_PORT + pid) for pid in range(1, 50)]
+        view = PeerView(0, peers, view_size=5, fanout=3, seed=1)
+        view.merge([(pid, 'localhost', BASE_PORT + pid) for pid in range(50, 60)] + [(0, 'localhost', BASE_PORT)])
+        self.assertEqual(len(view.peers), 5)
+        self.assertNotIn(0, view.peers)
+        targets = view.targets()
+        self.assertEqual(len({target[0] for target in targets}), 3)
+        self.assertTrue(all(target[0] in view.peers for target in targets))
+
+    def test_shuffle_sends_own_entry_and_merges_on_the_tick_loop(self):
+        """Test that shuffles carry the sender's address and are merged only by apply_pending."""
+        view = PeerView(0, [(1, 'localhost', 1), (2, 'localhost', 2)], view_size=3, shuffle_length=2, seed=2)
+        partner, entries = view.shuffle((0, 'localhost', 0))
+        self.assertIn(partner[0], (1, 2))
+        self.assertEqual(entries[0], (0, 'localhost', 0))
+        self.assertNotIn(partner[0], [entry[0] for entry in entries])
+        view.receive_shuffle([[7, 'localhost', 7]])
+        self.assertNotIn(7, view.peers)
+        view.apply_pending()
+        self.assertEqual(view.peers[7], ('localhost', 7))
+
+    def test_shuffle_advertises_the_reachable_address(self):
+        """Test that a VM bound to a wildcard address gossips its spec address, not the bind address."""
+        vm = VirtualMachine(vm_id=0, tick_rate=3, partner_info=[], run_duration=0, host='0.0.0.0',
+                            advertise_host='worker-a.example', port=7100)
+        vm.peer_view = PeerView(0, [(1, 'worker-b.example', 7100)], shuffle_every=1)
+        sent = []
+        vm.send_message = lambda host, port, message, partner_id: sent.append(message)
+        vm.gossip_tick()
+        self.assertEqual(tuple(sent[0]["peers"][0]), (0, 'worker-a.example', 7100))
+
+    def test_receive_logs_spread_and_adopts_winning_provenance(self):
+        """Test that a gossiped message's origin and hops are logged and carried on only if its clock wins."""
+        with tempfile.TemporaryDirectory() as tmp:
+            vm = VirtualMachine(vm_id=0, tick_rate=3, partner_info=[], run_duration=0, log_dir=tmp)
+            vm.process_message({"sender": 1, "clock": 9, "origin": 2, "origin_time": 99.5, "hops": 1}, 100)
+            self.assertEqual(vm.provenance, (2, 99.5, 2))
+            vm.process_message({"sender": 3, "clock": 1, "origin": 3, "origin_time": 100, "hops": 0}, 100)
+            self.assertIsNone(vm.provenance)
+            vm.close_logs()
+            with open(vm.log_filename) as file:
+                self.assertIn("Origin: 2, Hops: 2, Spread: 500.000 ms", file.read())
+
+class TestAdaptiveControl(unittest.TestCase):
+    """Tests for the backlog controller and how a VM acts on it."""
+
+    def test_extra_dequeues_grow_under_backlog_and_relax_after(self):
+        """Test that extra dequeues double while backlogged and step down once the queue drains."""
+        controller = AdaptiveController(queue_high=4, max_extra_dequeues=4)
+        self.assertEqual(controller.update(5, 0.0, 0.0), (True, False))
+        controller.update(5, 0.0, 0.1)
+        controller.update(5, 0.0, 0.2)
+        self.assertEqual(controller.extra_dequeues, 4)
+        self.assertEqual(controller.update(3, 0.0, 0.3), (False, False))  # Between the water marks
+        controller.update(0, 0.0, 0.4)
+        self.assertEqual(controller.extra_dequeues, 3)
+
+    def test_slowdown_is_signalled_once_per_cooldown(self):
+        """Test that peers are only asked to slow down again after the cooldown."""
+        controller = AdaptiveController(wait_high_ms=100, slowdown_factor=2, slowdown_cooldown=1.0)
+        self.assertTrue(controller.update(0, 150.0, 10.0)[1])
+        self.assertFalse(controller.update(0, 150.0, 10.5)[1])
+        self.assertTrue(controller.update(0, 150.0, 11.0)[1])
+
+    def test_backlogged_vm_drains_extra_messages_and_logs_it(self):
+        """Test that a backlogged VM processes several messages per tick and logs the controller action."""
+        with tempfile.TemporaryDirectory() as tmp:
+            vm = VirtualMachine(vm_id=0, tick_rate=3, partner_info=[], run_duration=0, log_dir=tmp,
+                                adaptive={"queue_high": 4, "max_extra_dequeues": 4})
+            for clock in range(10):
+                vm.enqueue({"sender": 1, "clock": clock})
+            vm.process_message(vm.message_queue.get_nowait(), system_time=100)
+            vm.adapt(system_time=100)
+            self.assertEqual(vm.message_queue.qsize(), 8)
+            vm.close_logs()
+            with open(vm.log_filename) as file:
+                lines = file.read().splitlines()
+        self.assertEqual(sum(line.startswith("RECEIVE") for line in lines), 2)
+        self.assertIn("Action: Extra Dequeues, Count: 1", next(line for line in lines if line.startswith("ADAPT")))
+
+    def test_slowdown_message_stretches_ticks_without_touching_the_clock(self):
+        """Test that a slowdown request bypasses the queue and lengthens the receiver's ticks."""
+        with tempfile.TemporaryDirectory() as tmp:
+            vm = VirtualMachine(vm_id=0, tick_rate=4, partner_info=[], run_duration=0, log_dir=tmp)
+            vm.enqueue(AdaptiveController(slowdown_factor=3, slowdown_duration=5).slowdown_message(1))
+            self.assertTrue(vm.message_queue.empty())
+            self.assertEqual(vm.logical_clock, 0)
+            self.assertAlmostEqual(vm.tick_interval(system_time=100), 0.75)
+            vm.close_logs()
+            with open(vm.log_filename) as file:
+                self.assertIn("Action: Slowdown Received, From VM: 1, Factor: 3", file.read())
+
+@unittest.skipIf(trial_aggregate is None, "pandas is not installed")
+class TestTrialAggregate(unittest.TestCase):
+    """Tests for cross-trial aggregation with bootstrap confidence intervals."""
+
+    def write_trial(self, trial_dir, config, clock_step):
+        os.makedirs(trial_dir)
+        with open(os.path.join(trial_dir, "trial_config.json"), "w") as file:
+            json.dump({"config": config, "tick_rate_range": [1, 6]}, file)
+        for vm_id in range(2):
+            with open(os.path.join(trial_dir, f"machine_{vm_id}.log"), "w") as file:
+                for i in range(10):
+                    clock = (i + 1) * (clock_step if vm_id else 1)
+                    file.write(f"INTERNAL | System Time: {100 + i:.4f} | Logical Clock: {clock} | \n")
+
+    def test_configs_are_aggregated_across_trials(self):
+        """Test that trials are tagged by config and summarized with per-config intervals."""
+        with tempfile.TemporaryDirectory() as tmp:
+            for trial, (config, step) in enumerate([("even", 1), ("even", 1), ("skewed", 2), ("skewed", 3)]):
+                self.write_trial(os.path.join(tmp, f"Trial{trial}"), config, step)
+            events_df = trial_aggregate.load_all_trials(tmp)
+        self.assertEqual(set(events_df["config"]), {"even", "skewed"})
+        self.assertIn("config_tick_rate_range", events_df.columns)
+        metrics_df = trial_aggregate.trial_metrics(events_df)
+        stats = trial_aggregate.aggregate_by_config(metrics_df, num_resamples=200).set_index(["config", "Metric"])
+        self.assertEqual(stats.loc[("even", "Avg Drift"), "Mean"], 0)
+        self.assertEqual(stats.loc[("skewed", "Max Drift"), "Trials"], 2)
+        self.assertGreater(stats.loc[("skewed", "Avg Drift"), "Mean"], 0)
+
+    def test_drift_comes_from_clock_snapshots_when_present(self):
+        """Test that a trial with a snapshot file gets its exact drift instead of the event-time estimate."""
+        with tempfile.TemporaryDirectory() as tmp:
+            for trial in range(2):
+                self.write_trial(os.path.join(tmp, f"Trial{trial}"), "even", 1)
+            board = ClockBoard(2)
+            board.publish(0, 10, 5)
+            board.publish(1, 4, 5)
+            run_sampler(board, os.path.join(tmp, "Trial1", "clock_snapshots.clk"), sample_rate=100, run_duration=0.05)
+            metrics_df = trial_aggregate.trial_metrics(trial_aggregate.load_all_trials(tmp), tmp).set_index("Trial")
+        self.assertEqual(metrics_df.loc["Trial0", "Drift Source"], "events")
+        self.assertEqual(metrics_df.loc["Trial0", "Avg Drift"], 0)
+        self.assertEqual(metrics_df.loc["Trial1", "Drift Source"], "snapshots")
+        self.assertEqual((metrics_df.loc["Trial1", "Avg Drift"], metrics_df.loc["Trial1", "Max Drift"]), (6, 6))
+
+    def test_config_map_labels_trials_without_a_config_file(self):
+        """Test that older trials take their label from the folder -> config map."""
+        with tempfile.TemporaryDirectory() as tmp:
+            for trial in range(3):
+                trial_dir = os.path.join(tmp, f"Trial{trial}")
+                self.write_trial(trial_dir, "tagged", 1)
+                if trial:
+                    os.remove(os.path.join(trial_dir, "trial_config.json"))
+            events_df = trial_aggregate.load_all_trials(tmp, {"Trial1": "less_internal"})
+        labels = events_df.groupby("Trial")["config"].first().to_dict()
+        self.assertEqual(labels, {"Trial0": "tagged", "Trial1": "less_internal", "Trial2": "unlabeled"})
+
+    def test_bootstrap_interval_brackets_the_mean(self):
+        """Test that the vectorized bootstrap gives per-column intervals around each column's mean."""
+        values = np.column_stack([np.arange(100.0), np.full(100, 5.0)])
+        means, lows, highs = trial_aggregate.bootstrap_ci(values, num_resamples=500)
+        self.assertTrue(np.all(lows <= means) and np.all(means <= highs))
+        self.assertAlmostEqual(means[0], 49.5)
+        self.assertEqual((lows[1], highs[1]), (5.0, 5.0))
+
+    def test_bootstrap_chunks_and_missing_metrics(self):
+        """Test that chunking resamples does not change the interval and NaN metric values are skipped."""
+        values = np.array([[1.0, np.nan], [2.0, np.nan], [4.0, 3.0], [8.0, np.nan]])
+        whole = trial_aggregate.bootstrap_ci(values, num_resamples=300)
+        chunked = trial_aggregate.bootstrap_ci(values, num_resamples=300, chunk_cells=8)
+        for a, b in zip(whole, chunked):
+            np.testing.assert_allclose(a, b)
+        self.assertEqual(whole[0][1], 3.0)
+        self.assertEqual((whole[1][1], whole[2][1]), (3.0, 3.0))
+
+class TestColumnarLog(unittest.TestCase):
+    """Unit tests for columnar trial output."""
+
+    def test_event_codes_from_text_event_types(self):
+        """Test that text event types map onto the columnar event codes."""
+        self.assertEqual(event_code("INTERNAL"), EVENT_CODES["INTERNAL"])
+        self.assertEqual(event_code("SEND to VM 2"), EVENT_CODES["SEND"])
+        self.assertEqual(event_code("SEND to VMs 1, 2"), EVENT_CODES["BROADCAST"])
+        self.assertEqual(event_code("RECEIVE"), EVENT_CODES["RECEIVE"])
+        self.assertIsNone(event_code("TRANSPORT"))
+
+    @unittest.skipIf(columnar_log.pa is None, "pyarrow is not installed")
+    def test_columnar_mode_keeps_summary_lines_as_text(self):
+        """Test that columnar-only logging still writes lines with no column code, such as TRANSPORT."""
+        with tempfile.TemporaryDirectory() as tmp:
+            vm = VirtualMachine(vm_id=0, tick_rate=3, partner_info=[], run_duration=10, log_dir=tmp,
+                                log_format="columnar")
+            vm.logical_clock += 1
+            vm.log_event("INTERNAL", system_time=100)
+            vm.log_event("TRANSPORT", system_time=101, additional_info="Transport: udp, Sent: 0")
+            vm.close_logs()
+            with open(vm.log_filename) as file:
+                lines = file.read().splitlines()
+            table = read_table(vm.columnar_log.path).to_pydict()
+        self.assertEqual(len(lines), 1)
+        self.assertTrue(lines[0].startswith("TRANSPORT"))
+        self.assertEqual(table["event"], [EVENT_CODES["INTERNAL"]])
+
+    @unittest.skipIf(columnar_log.pa is None, "pyarrow is not installed")
+    def test_switching_text_log_keeps_columnar_table_open(self):
+        """Test that opening a text log at a new path does not close the columnar table."""
+        with tempfile.TemporaryDirectory() as tmp:
+            vm = VirtualMachine(vm_id=0, tick_rate=3, partner_info=[], run_duration=10, log_dir=tmp,
+                                log_format="both")
+            vm.columnar_log.row_group_size = 1
+            vm.logical_clock += 1
+            vm.log_event("INTERNAL", system_time=100)
+            vm.log_filename = os.path.join(tmp, "moved.log")
+            vm.logical_clock += 1
+            vm.log_event("INTERNAL", system_time=101)
+            self.assertIsNotNone(vm.columnar_log.writer)
+            vm.close_logs()
+            table = read_table(vm.columnar_log.path).to_pydict()
+        self.assertEqual(table["logical_clock"], [1, 2])
+
+    @unittest.skipIf(columnar_log.pa is None, "pyarrow is not installed")
+    def test_columnar_events_merge_into_one_trial_table(self):
+        """Test that per-VM row groups merge into one table tagged by vm_id, with no text log."""
+        with tempfile.TemporaryDirectory() as tmp:
+            cwd = os.getcwd()
+            os.chdir(tmp)
+            try:
+                for vm_id in range(2):
+                    vm = VirtualMachine(vm_id=vm_id, tick_rate=3, partner_info=[], run_duration=10,
+                                        log_format="columnar")
+                    vm.columnar_log.row_group_size = 2
+                    for _ in range(3):
+                        vm.logical_clock += 1
+                        vm.log_event("INTERNAL", system_time=100 + vm.logical_clock)
+                    vm.process_message({"sender": 1 - vm_id, "clock": 9}, system_time=110)
+                    vm.columnar_log.close()
+                path = merge_trial_tables(".", range(2))
+                table = read_table(path).to_pydict()
+                self.assertFalse(os.path.exists("machine_0.log"))
+            finally:
+                os.chdir(cwd)
+        self.assertEqual(table["vm_id"], [0, 0, 0, 0, 1, 1, 1, 1])
+        self.assertEqual(table["logical_clock"][:4], [1, 2, 3, 10])
+        self.assertEqual(table["event"][3], EVENT_CODES["RECEIVE"])
+        self.assertEqual(table["peer"][3], 1)
+
+@unittest.skipUnless(os.environ.get("RUN_PERF_TESTS"), "set RUN_PERF_TESTS=1 to run the performance tier")
+class TestPerformance(unittest.TestCase):
+    """Performance floors for the hot paths; a regression there fails here instead of going unnoticed.
+
+    Opt-in because the assertions are on wall-clock rates: RUN_PERF_TESTS=1 python -m pytest -q -k Performance
+    """
+
+    SEED = 2620
+    TICK_RATE = 100
+    RUN_DURATION = 2.0
+    HOT_PATH_ROUNDS = 50_000
+    MIN_TICKS_PER_SEC = 40_000      # One VM's tick loop with sleep stubbed out; about 80000 on a laptop
+    MIN_ROUNDS_PER_SEC = 50_000     # enqueue, pop, process_message and one INTERNAL log_event; about 100000
+    MESSAGES = 2000
+    MIN_MESSAGES_PER_SEC = 150      # Sent over TCP and enqueued by the listener; about 300 on a laptop
+    # run() sleeps a full tick after each tick's work, so achieved rates sit a few percent below configured.
+    TICK_RATE_TOLERANCE = 0.15
+    LOG_LINES = 1_000_000
+    ANALYSIS_BUDGET = 30.0          # Seconds to parse and analyze LOG_LINES; about 5 on a laptop
+
+    def test_tick_loop_throughput(self):
+        """Test the ticks/sec floor of the tick loop with time.sleep stubbed out, so only its own work counts."""
+        with tempfile.TemporaryDirectory() as tmp:
+            vm = VirtualMachine(vm_id=0, tick_rate=self.TICK_RATE, partner_info=[], run_duration=0.5, log_dir=tmp,
+                                seed=self.SEED)
+            with mock.patch("distributed_simulation.time.sleep"):
+                vm.run()
+        self.assertGreaterEqual(vm.ticks / vm.tick_loop_seconds, self.MIN_TICKS_PER_SEC)
+
+    def test_message_hot_path_throughput(self):
+        """Test the floor of a tight loop over enqueue, MessageInbox.pop, process_message and log_event."""
+        with tempfile.TemporaryDirectory() as tmp:
+            vm = VirtualMachine(vm_id=0, tick_rate=self.TICK_RATE, partner_info=[], run_duration=0, log_dir=tmp)
+            system_time = time.time()
+            start = time.perf_counter()
+            for i in range(self.HOT_PATH_ROUNDS):
+                vm.enqueue({"sender": 1, "clock": i, "seq": i, "sent_at": time.monotonic()})
+                message, q_len = vm.message_queue.pop()
+                vm.process_message(message, system_time, q_len)
+                vm.logical_clock += 1
+                vm.log_event("INTERNAL", system_time)
+            elapsed = time.perf_counter() - start
+            vm.close_logs()
+        self.assertEqual(vm.transport_stats["received"], self.HOT_PATH_ROUNDS)
+        self.assertGreaterEqual(self.HOT_PATH_ROUNDS / elapsed, self.MIN_ROUNDS_PER_SEC)
+
+    def test_tcp_message_throughput(self):
+        """Test the messages/sec floor from send_message until the receiving listener has enqueued each one."""
+        with tempfile.TemporaryDirectory() as tmp:
+            receiver = VirtualMachine(vm_id=1, tick_rate=1, partner_info=[], run_duration=0, log_dir=tmp, port=0)
+            sender = VirtualMachine(vm_id=0, tick_rate=1, partner_info=[], run_duration=0, log_dir=tmp, port=0)
+            receiver.bind()
+            listener = threading.Thread(target=receiver.start_listener)
+            listener.start()
+            try:
+                start = time.perf_counter()
+                for clock in range(self.MESSAGES):
+                    sender.send_message('localhost', receiver.port, {"sender": 0, "clock": clock})
+                while receiver.message_queue.qsize() < self.MESSAGES and time.perf_counter() - start < 60:
+                    time.sleep(0.001)
+                elapsed = time.perf_counter() - start
+            finally:
+                receiver.stop_event.set()
+                listener.join()
+        self.assertEqual(receiver.message_queue.qsize(), self.MESSAGES)
+        self.assertGreaterEqual(self.MESSAGES / elapsed, self.MIN_MESSAGES_PER_SEC)
+
+    def test_in_process_simulation_tick_rate(self):
+        """Test that each of three seeded VMs keeps close to its configured tick rate while messages flow."""
+        with tempfile.TemporaryDirectory() as tmp:
+            registry = PortRegistry(3)
+            barrier = threading.Barrier(3)
+            vms = [VirtualMachine(vm_id=i, tick_rate=self.TICK_RATE, run_duration=self.RUN_DURATION, log_dir=tmp,
+                                  port=0, registry=registry, start_barrier=barrier, seed=self.SEED + i,
+                                  partner_info=[(p, 'localhost', None) for p in range(3) if p != i])
+                   for i in range(3)]
+            threads = [threading.Thread(target=vm.run) for vm in vms]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        for vm in vms:
+            achieved = vm.ticks / vm.tick_loop_seconds
+            self.assertGreater(vm.transport_stats["received"], 0)
+            self.assertAlmostEqual(achieved, self.TICK_RATE, delta=self.TICK_RATE * self.TICK_RATE_TOLERANCE,
+                                   msg=f"VM {vm.vm_id} ticked at {achieved:.1f}/s")
+
+    @unittest.skipIf(analysis_visualization is None, "pandas is not installed")
+    def test_million_line_log_analysis_within_budget(self):
+        """Test that parsing and analyzing a generated 1M-line log finishes within the time budget."""
+        rng = random.Random(self.SEED)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "machine_0.log")
+            clock = 0
+            system_time = 1_700_000_000.0
+            with open(path, "w") as file:
+                for _ in range(self.LOG_LINES):
+                    system_time += 0.01
+                    draw = rng.random()
+                    if draw < 0.3:
+                        clock += rng.randint(1, 5)
+                        file.write(f"RECEIVE | System Time: {system_time:.4f} | Logical Clock: {clock} | From VM 1, "
+                                   f"Queue Length: 0, Queue Wait: 1.250 ms, Latency: 0.500 ms\n")
+                    elif draw < 0.5:
+                        clock += 1
+                        file.write(f"SEND to VM 1 | System Time: {system_time:.4f} | Logical Clock: {clock} | "
+                                   f"Message Clock Sent: {clock - 1}\n")
+                    else:
+                        clock += 1
+                        file.write(f"INTERNAL | System Time: {system_time:.4f} | Logical Clock: {clock} | \n")
+            start = time.perf_counter()
+            df = analysis_visualization.parse_log(path)
+            jumps = analysis_visualization.analyze_clock_jumps(df, 0)
+            analysis_visualization.analyze_clock_gaps(df, 0)
+            latency_df = analysis_visualization.analyze_message_latency({0: df})
+            elapsed = time.perf_counter() - start
+        self.assertEqual(len(df), self.LOG_LINES)
+        self.assertGreater(jumps["Avg Clock Jump"], 1)
+        self.assertFalse(latency_df.empty)
+        self.assertLess(elapsed, self.ANALYSIS_BUDGET)
+
 if __name__ == "__main__":
     unittest.main()
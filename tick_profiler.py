@@ -0,0 +1,82 @@
+import array
+import time
+
+# Phases of one VirtualMachine tick, in the order they happen
+PHASES = ("dequeue", "process", "send", "log", "sleep")
+DEQUEUE, PROCESS, SEND, LOG, SLEEP = range(len(PHASES))
+
+class TickProfiler:
+    """Per-tick phase timings kept in a fixed-size ring buffer of nanosecond counters.
+
+    The tick loop calls mark(phase) after each phase; time spent inside log_event is
+    charged to LOG with add() and excluded from whichever phase it interrupted.
+    """
+
+    def __init__(self, capacity=65536, sleep_target=0.0):
+        self.capacity = capacity
+        self.ring = array.array('q', bytes(8 * capacity * len(PHASES)))
+        self.ticks = 0                      # Ticks recorded in total; the ring keeps the latest capacity
+        self.sleep_target_ns = int(sleep_target * 1e9)
+        self.current = [0] * len(PHASES)
+        self.last = time.perf_counter_ns()
+        self.excluded = 0
+
+    def start_tick(self):
+        self.last = time.perf_counter_ns()
+        self.excluded = 0
+
+    def mark(self, phase):
+        """Charge the time since the previous mark to phase."""
+        now = time.perf_counter_ns()
+        self.current[phase] += now - self.last - self.excluded
+        self.last = now
+        self.excluded = 0
+
+    def add(self, phase, elapsed_ns):
+        """Charge a separately measured duration to phase, taking it out of the next mark."""
+        self.current[phase] += elapsed_ns
+        self.excluded += elapsed_ns
+
+    def end_tick(self):
+        base = (self.ticks % self.capacity) * len(PHASES)
+        current = self.current
+        for phase in range(len(PHASES)):
+            self.ring[base + phase] = current[phase]
+            current[phase] = 0
+        self.ticks += 1
+
+    def phase_samples(self, phase):
+        """Durations (ns) of one phase for every tick still in the ring."""
+        retained = min(self.ticks, self.capacity)
+        return self.ring[phase:retained * len(PHASES):len(PHASES)]
+
+    def summary(self):
+        """Return {phase: {total, mean, p50, p99, max}} in milliseconds over the retained ticks."""
+        result = {}
+        for phase, name in enumerate(PHASES):
+            samples = sorted(self.phase_samples(phase))
+            if not samples:
+                continue
+            result[name] = {"total": sum(samples) / 1e6, "mean": sum(samples) / len(samples) / 1e6,
+                            "p50": samples[len(samples) // 2] / 1e6,
+                            "p99": samples[min(len(samples) - 1, int(len(samples) * 0.99))] / 1e6,
+                            "max": samples[-1] / 1e6}
+        if "sleep" in result:
+            result["sleep"]["overshoot"] = result["sleep"]["mean"] - self.sleep_target_ns / 1e6
+        return result
+
+    def write_summary(self, path, vm_id):
+        summary = self.summary()
+        retained = min(self.ticks, self.capacity)
+        with open(path, "w") as file:
+            file.write(f"VM {vm_id} tick profile: {self.ticks} ticks, last {retained} retained (ms)\n")
+            for name, stats in summary.items():
+                file.write(f"{name:>8} | " + ", ".join(f"{key}: {value:.3f}" for key, value in stats.items()) + "\n")
+
+    def write_folded(self, path, vm_id):
+        """Write a folded-stack profile (one 'frame;frame value' line per phase, in microseconds)."""
+        with open(path, "w") as file:
+            for phase, name in enumerate(PHASES):
+                total_us = sum(self.phase_samples(phase)) // 1000
+                if total_us:
+                    file.write(f"vm_{vm_id};run;{name} {total_us}\n")
@@ -0,0 +1,174 @@
+import argparse
+import json
+import os
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from analysis_visualization import clock_jump_totals, load_clock_snapshots, load_trial_logs, snapshot_drift_matrix
+from clock_board import SNAPSHOT_FILENAME
+from columnar_log import pa
+from distributed_simulation import TRIAL_CONFIG_FILENAME
+
+UNLABELED_CONFIG = "unlabeled"
+
+METRICS = ["Avg Clock Jump", "Max Clock Jump", "Large Gaps Count", "Avg Drift", "Max Drift",
+           "Avg Queue Length", "Max Queue Length"]
+
+# Find every trial folder (a folder holding machine logs or a columnar trial table) under base_dir
+def find_trials(base_dir):
+    trials = []
+    for root, dirs, files in os.walk(base_dir):
+        dirs.sort()
+        if any(name.startswith("machine_") or name.startswith("trial.") for name in files):
+            trials.append(root)
+    return trials
+
+# Read a trial's config tags. Trials that predate trial_config.json (such as the less_internal and
+# small_variation runs) take their label from config_map, {trial folder: config}, or are unlabeled.
+def load_trial_config(trial_path, config_map=None, trial_name=None):
+    config_path = os.path.join(trial_path, TRIAL_CONFIG_FILENAME)
+    if not os.path.exists(config_path):
+        return {"config": (config_map or {}).get(trial_name, UNLABELED_CONFIG)}
+    with open(config_path) as file:
+        return json.load(file)
+
+# Stack every trial's events into one table tagged with trial and config columns
+def load_all_trials(base_dir, config_map=None):
+    frames = []
+    for trial_path in find_trials(base_dir):
+        trial_name = os.path.relpath(trial_path, base_dir)
+        config = load_trial_config(trial_path, config_map, trial_name)
+        for vm_id, df in load_trial_logs(trial_path).items():
+            if df.empty:
+                continue
+            df = df.assign(**{"Trial": trial_name, "VM": vm_id})
+            for key, value in config.items():
+                df[key if key == "config" else f"config_{key}"] = value if np.isscalar(value) else json.dumps(value)
+            frames.append(df)
+    if not frames:
+        return pd.DataFrame()
+    return pd.concat(frames, ignore_index=True)
+
+# Mean absolute clock drift of each VM against every other VM, sampled at the other VM's events
+def trial_drift(trial_df):
+    drifts = []
+    vms = {vm_id: vm_df[["System Time", "Logical Clock"]].sort_values("System Time")
+           for vm_id, vm_df in trial_df.groupby("VM")}
+    for ref_id, ref_df in vms.items():
+        for other_id, other_df in vms.items():
+            if other_id <= ref_id:
+                continue
+            merged = pd.merge_asof(ref_df, other_df, on="System Time", direction="nearest", suffixes=("", " Other"))
+            drifts.append((merged["Logical Clock"] - merged["Logical Clock Other"]).abs())
+    if not drifts:
+        return np.nan, np.nan
+    drift = pd.concat(drifts)
+    return drift.mean(), drift.max()
+
+# Exact drift from a trial's shared-memory clock snapshots: mean and max over every pair of VMs
+def snapshot_drift(snapshot_path):
+    avg_df, max_df = snapshot_drift_matrix(load_clock_snapshots(snapshot_path))
+    pairs = np.triu_indices(len(avg_df), k=1)
+    if not len(pairs[0]):
+        return np.nan, np.nan
+    return avg_df.to_numpy()[pairs].mean(), max_df.to_numpy()[pairs].max()
+
+# One row of jump/gap/drift/queue metrics per trial; drift comes from clock snapshots when base_dir has them
+def trial_metrics(events_df, base_dir=None):
+    rows = []
+    for trial, trial_df in events_df.groupby("Trial", sort=True):
+        jump_totals = [clock_jump_totals(vm_df.reset_index(drop=True)) for _, vm_df in trial_df.groupby("VM")]
+        snapshot_path = os.path.join(base_dir, trial, SNAPSHOT_FILENAME) if base_dir is not None else None
+        if snapshot_path is not None and os.path.exists(snapshot_path):
+            avg_drift, max_drift = snapshot_drift(snapshot_path)
+            drift_source = "snapshots"
+        else:
+            avg_drift, max_drift = trial_drift(trial_df)
+            drift_source = "events"
+        queue = trial_df.loc[trial_df["Event"] == "RECEIVE", "Queue Length"] \
+            if "Queue Length" in trial_df.columns else pd.Series(dtype=float)
+        rows.append({
+            "Trial": trial,
+            "config": trial_df["config"].iloc[0],
+            "Avg Clock Jump": sum(t["advance"] for t in jump_totals) / sum(t["events"] for t in jump_totals),
+            "Max Clock Jump": max(t["max"] for t in jump_totals),
+            "Large Gaps Count": sum(t["large"] for t in jump_totals),  # Jumps > LARGE_GAP
+            "Avg Drift": avg_drift,
+            "Max Drift": max_drift,
+            "Drift Source": drift_source,
+            "Avg Queue Length": queue.mean(),
+            "Max Queue Length": queue.max(),
+        })
+    return pd.DataFrame(rows)
+
+# Mean of each column with a percentile bootstrap CI, resampling all columns at once
+def bootstrap_ci(values, num_resamples=2000, confidence=0.95, seed=0, chunk_cells=1 << 20):
+    values = np.asarray(values, dtype=float)
+    n = values.shape[0]
+    rng = np.random.default_rng(seed)
+    alpha = (1 - confidence) / 2
+    present = ~np.isnan(values)
+    filled = np.where(present, values, 0.0)
+    # Each resample is a row of counts (how often each trial was drawn); with the NaN mask, one matrix
+    # product gives every column's resampled sum and sample count. Chunks keep counts to ~chunk_cells.
+    chunk = max(1, chunk_cells // max(n, 1))
+    resampled_means = []
+    with warnings.catch_warnings(), np.errstate(invalid="ignore", divide="ignore"):
+        # Metrics with no samples at all (e.g. no RECEIVE events) just stay NaN.
+        warnings.simplefilter("ignore", RuntimeWarning)
+        for start in range(0, num_resamples, chunk):
+            counts = rng.multinomial(n, np.full(n, 1 / n), size=min(chunk, num_resamples - start)).astype(float)
+            resampled_means.append((counts @ filled) / (counts @ present))
+        low, high = np.nanquantile(np.vstack(resampled_means), [alpha, 1 - alpha], axis=0)
+        return np.nanmean(values, axis=0), low, high
+
+# Per-configuration mean and bootstrap confidence interval of every trial metric
+def aggregate_by_config(metrics_df, num_resamples=2000, confidence=0.95, seed=0):
+    rows = []
+    for config, config_df in metrics_df.groupby("config", sort=True):
+        values = config_df[METRICS].to_numpy(dtype=float)
+        means, lows, highs = bootstrap_ci(values, num_resamples, confidence, seed)
+        for metric, mean, low, high in zip(METRICS, means, lows, highs):
+            rows.append({"config": config, "Metric": metric, "Trials": len(config_df),
+                         "Mean": mean, "CI Low": low, "CI High": high})
+    return pd.DataFrame(rows)
+
+def save_events(events_df, output_dir):
+    """Write the combined event table as Parquet, or CSV when pyarrow is missing."""
+    if pa is not None:
+        path = os.path.join(output_dir, "all_trial_events.parquet")
+        events_df.to_parquet(path, index=False)
+    else:
+        path = os.path.join(output_dir, "all_trial_events.csv")
+        events_df.to_csv(path, index=False)
+    return path
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Aggregate statistics across every trial, per configuration.")
+    parser.add_argument("--base-dir", default="trials", help="Folder searched recursively for trials")
+    parser.add_argument("--output-dir", default=None, help="Where to write results (default: base dir)")
+    parser.add_argument("--resamples", type=int, default=2000, help="Bootstrap resamples per configuration")
+    parser.add_argument("--confidence", type=float, default=0.95, help="Confidence level of the intervals")
+    parser.add_argument("--config-map", default=None,
+                        help="JSON file of {trial folder: config} labels for trials without trial_config.json")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    output_dir = args.output_dir or args.base_dir
+    os.makedirs(output_dir, exist_ok=True)
+    config_map = None
+    if args.config_map:
+        with open(args.config_map) as file:
+            config_map = json.load(file)
+    events_df = load_all_trials(args.base_dir, config_map)
+    if events_df.empty:
+        raise SystemExit(f"No trials found under {args.base_dir}.")
+    print(f"Saved combined events to {save_events(events_df, output_dir)}.")
+    metrics_df = trial_metrics(events_df, args.base_dir)
+    metrics_df.to_csv(os.path.join(output_dir, "trial_metrics.csv"), index=False)
+    aggregate_df = aggregate_by_config(metrics_df, args.resamples, args.confidence)
+    aggregate_df.to_csv(os.path.join(output_dir, "config_statistics.csv"), index=False)
+    print(f"Aggregated {len(metrics_df)} trials across {metrics_df['config'].nunique()} configurations.")